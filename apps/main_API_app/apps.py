@@ -5,3 +5,7 @@ from django.apps import AppConfig
 class MainApiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.main_API_app'
+
+    def ready(self):
+        # Connects the signal receivers, that invalidate cached availability
+        from . import signals
@@ -0,0 +1,107 @@
+# Third party imports
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# Local app imports
+from .caching import PROCESS_LOCAL_BACKENDS
+
+# User fields, that are kept in the cached snapshot. The other fields are loaded from the database
+# only if they are accessed (like deferred fields of a queryset with .only()).
+SNAPSHOT_FIELDS = ('id', 'username', 'is_superuser', 'is_staff', 'is_active')
+
+
+def get_user_cache_settings() -> dict:
+    """
+    Returns JWT_USER_CACHE settings: ALIAS of the cache, TIMEOUT of the snapshots in seconds
+    and SHARED (see snapshots_enabled()).
+    """
+    return {'ALIAS': 'default', 'TIMEOUT': 60, 'SHARED': None, **getattr(settings, 'JWT_USER_CACHE', {})}
+
+
+def get_user_cache():
+    return caches[get_user_cache_settings()['ALIAS']]
+
+
+def snapshots_enabled() -> bool:
+    """
+    Checks, that the snapshots are kept in a cache, that all processes (gunicorn workers) share.
+    In a per-process one (LocMemCache is the default without REDIS_URL) a snapshot, that one worker
+    has deleted, would stay in the others, so a deactivated user could still be authenticated there.
+    JWT_USER_CACHE['SHARED'] overrides the check, e.g. when a single process serves the requests.
+    """
+    shared = get_user_cache_settings()['SHARED']
+    if shared is not None:
+        return shared
+    return not isinstance(get_user_cache(), PROCESS_LOCAL_BACKENDS)
+
+
+def user_snapshot_key(user_id) -> str:
+    """
+    :param user_id: value of the token's user id claim, the user's pk (SIMPLE_JWT['USER_ID_FIELD'] is 'id')
+    """
+    return f'auth:user:{user_id}'
+
+
+def make_user_snapshot(user) -> dict:
+    return {'fields': {field: getattr(user, field) for field in SNAPSHOT_FIELDS},
+            'permissions': sorted(user.get_all_permissions())}
+
+
+def user_from_snapshot(snapshot: dict):
+    """
+    Builds a User instance from the snapshot without a database query. Fields, that aren't in the snapshot,
+    are deferred, and user.save() writes only the snapshot fields. Permission checks (user.has_perm())
+    use the cached permissions.
+    """
+    user_model = get_user_model()
+    fields = snapshot['fields']
+    concrete_fields = [field.attname for field in user_model._meta.concrete_fields if field.attname in fields]
+    user = user_model.from_db(user_model.objects.db, concrete_fields, [fields[field] for field in concrete_fields])
+    user._perm_cache = set(snapshot['permissions'])
+    return user
+
+
+def invalidate_user_snapshot(user_id) -> None:
+    """
+    Deletes the cached snapshot now and once again after the commit, so that a request, that has read
+    the user before the commit, can't keep the outdated snapshot longer than until the next change.
+    """
+    key = user_snapshot_key(user_id)
+    get_user_cache().delete(key)
+    transaction.on_commit(lambda: get_user_cache().delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication, that caches a lightweight snapshot of the token's user (see SNAPSHOT_FIELDS
+    and JWT_USER_CACHE settings), so that most of the authenticated requests don't query the User table.
+    Snapshots are deleted, when the user, its groups or permissions are changed (see signals.py),
+    and expire after JWT_USER_CACHE['TIMEOUT'] anyway. Without a shared cache (see snapshots_enabled()),
+    the user is loaded from the database on every request, as JWTAuthentication does.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        if not snapshots_enabled():
+            return super().get_user(validated_token)
+
+        cache = get_user_cache()
+        key = user_snapshot_key(user_id)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            # raises AuthenticationFailed for missing and inactive users, so they are never cached
+            snapshot = make_user_snapshot(super().get_user(validated_token))
+            cache.set(key, snapshot, get_user_cache_settings()['TIMEOUT'])
+
+        if not snapshot['fields']['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        return user_from_snapshot(snapshot)
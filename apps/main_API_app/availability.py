@@ -0,0 +1,304 @@
+# Standard library imports
+import heapq
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable
+
+# Third party imports
+from django.conf import settings
+
+# Local app imports
+from . import caching
+from .metrics import measure_availability
+from .schedules import ScheduleIndex, get_schedule_index
+from .models import Worker, Location, Schedule, Appointment
+from .routers import primary_reads
+
+MINUTES_PER_DAY = 24 * 60
+
+DEFAULT_SLOT_LENGTH = 60
+DEFAULT_BUFFER_TIME = 0
+
+
+def to_minutes(value: time, round_up: bool = False) -> int:
+    """
+    Converts time to the number of minutes since midnight.
+    :param value: time
+    :param round_up: if True, incomplete minutes are rounded up (used for the end of a time range)
+    :return: int
+    """
+    minutes = value.hour * 60 + value.minute
+    if round_up and (value.second or value.microsecond):
+        minutes += 1
+    return minutes
+
+
+def format_minutes(minutes: int) -> str:
+    """
+    Converts the number of minutes since midnight to 'HH:MM' string.
+    """
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def minutes_mask(start: int, stop: int) -> int:
+    """
+    Returns a day bitset with the minutes from start (inclusive) to stop (exclusive) set.
+    Bit N of the bitset stands for the N-th minute of the day.
+    """
+    start, stop = max(start, 0), min(stop, MINUTES_PER_DAY)
+    if stop <= start:
+        return 0
+    return ((1 << (stop - start)) - 1) << start
+
+
+def get_slot_settings(worker: Worker) -> tuple:
+    """
+    Returns the slot length and the buffer time for the worker. Values set on the worker
+    take precedence over the specialty settings, which take precedence over the defaults:
+
+        APPOINTMENT_SLOTS = {
+            'SLOT_LENGTH': 60,
+            'BUFFER_TIME': 0,
+            'SPECIALTIES': {'Therapist': {'SLOT_LENGTH': 20, 'BUFFER_TIME': 5}},
+        }
+
+    :param worker: Worker class instance
+    :return: (slot length, buffer time) in minutes
+    """
+    slot_settings = getattr(settings, 'APPOINTMENT_SLOTS', {})
+    specialties = {specialty.lower(): values for specialty, values in slot_settings.get('SPECIALTIES', {}).items()}
+    specialty_settings = specialties.get((worker.specialty or '').lower(), {})
+
+    slot_length = worker.slot_length or specialty_settings.get('SLOT_LENGTH') \
+        or slot_settings.get('SLOT_LENGTH', DEFAULT_SLOT_LENGTH)
+    if worker.buffer_time is not None:
+        buffer_time = worker.buffer_time
+    else:
+        buffer_time = specialty_settings.get('BUFFER_TIME', slot_settings.get('BUFFER_TIME', DEFAULT_BUFFER_TIME))
+
+    return slot_length, buffer_time
+
+
+def get_free_minutes(schedules: Iterable[Schedule], appointments: Iterable[Appointment],
+                     buffer_time: int = DEFAULT_BUFFER_TIME) -> int:
+    """
+    Returns a day bitset of the minutes, that are covered by the schedules and are not closer
+    than buffer_time to any of the appointments.
+    :param schedules: schedules for the requested weekday
+    :param appointments: appointments for the requested date
+    :param buffer_time: break between appointments in minutes
+    :return: int
+    """
+    working = 0
+    for schedule in schedules:
+        working |= minutes_mask(to_minutes(schedule.from_hour), to_minutes(schedule.to_hour))
+
+    booked = 0
+    for appointment in appointments:
+        booked |= minutes_mask(to_minutes(appointment.start_time) - buffer_time,
+                               to_minutes(appointment.end_time, round_up=True) + buffer_time)
+
+    return working & ~booked
+
+
+def is_free(free_minutes: int, start: int, length: int) -> bool:
+    """
+    Checks that all minutes from start to start + length are set in the free_minutes bitset.
+    """
+    slot_mask = (1 << length) - 1
+    return (free_minutes >> start) & slot_mask == slot_mask
+
+
+def compute_free_slot_minutes(schedules: Iterable[Schedule], appointments: Iterable[Appointment],
+                              slot_length: int = DEFAULT_SLOT_LENGTH,
+                              buffer_time: int = DEFAULT_BUFFER_TIME) -> list:
+    """
+    Calculates free slots from already loaded schedules and appointments of a single worker.
+    Working and booked minutes of the day are kept in bitsets. Slots follow each other from
+    the start of every schedule, and a slot is free when all of its minutes are working minutes
+    and none of them is closer than buffer_time to an appointment.
+    :param schedules: worker's schedules for the requested weekday
+    :param appointments: worker's appointments for the requested date
+    :param slot_length: slot length in minutes
+    :param buffer_time: break between appointments in minutes
+    :return: sorted slot starts, minutes since midnight (list)
+    """
+    schedules = list(schedules)
+    available = get_free_minutes(schedules, appointments, buffer_time)
+
+    free_slots = set()
+    for schedule in schedules:
+        start, stop = to_minutes(schedule.from_hour), to_minutes(schedule.to_hour)
+        for minute in range(start, stop - slot_length + 1, slot_length + buffer_time):
+            if is_free(available, minute, slot_length):
+                free_slots.add(minute)
+
+    return sorted(free_slots)
+
+
+def compute_free_slots(schedules: Iterable[Schedule], appointments: Iterable[Appointment],
+                       slot_length: int = DEFAULT_SLOT_LENGTH, buffer_time: int = DEFAULT_BUFFER_TIME) -> list:
+    """
+    Calculates free slots of a single worker, see compute_free_slot_minutes().
+    :return: sorted free slots, 'HH:MM' strings (list)
+    """
+    return [format_minutes(minute)
+            for minute in compute_free_slot_minutes(schedules, appointments, slot_length, buffer_time)]
+
+
+def group_appointments(workers: Iterable[Worker], date_from: date, date_to: date) -> dict:
+    """
+    Loads appointments of the workers for the date range with a single query.
+    :param workers: Worker instances
+    :param date_from: first date of the range
+    :param date_to: last date of the range (inclusive)
+    :return: dictionary {(worker pk, date): appointments (list)}
+    """
+    appointments = defaultdict(list)
+    worker_appointments = Appointment.objects.filter(worker__in=[worker.pk for worker in workers],
+                                                     date__range=(date_from, date_to))\
+        .only('worker', 'date', 'start_time', 'end_time')
+    for appointment in worker_appointments:
+        appointments[(appointment.worker_id, appointment.date)].append(appointment)
+
+    return appointments
+
+
+def compute_worker_free_slots(worker: Worker, requested_date: date, appointments: dict,
+                              schedule_index: ScheduleIndex) -> list:
+    """
+    Calculates free slots of the worker for a single date from preloaded data.
+    :param worker: Worker instance
+    :param requested_date: date to calculate the slots for
+    :param appointments: appointments grouped by group_appointments()
+    :param schedule_index: ScheduleIndex, see get_schedule_index()
+    :return: free slots (list)
+    """
+    schedules = schedule_index.get_worker_schedules(worker.pk, requested_date.weekday())
+
+    return compute_free_slots(schedules, appointments.get((worker.pk, requested_date), ()),
+                              *get_slot_settings(worker))
+
+
+def get_available_slots_map(workers: Iterable[Worker], requested_date: date) -> dict:
+    """
+    Calculates free slots for many workers at once. Slots of the workers are taken from the cache
+    if possible. For the rest of them, appointments are loaded with a single query, and schedules
+    are taken from the ScheduleIndex, so the number of queries doesn't depend on the number of workers.
+    Calculated slots are cached, so their appointments are read from the primary database.
+    :param workers: Worker instances
+    :param requested_date: date to calculate the slots for
+    :return: dictionary {worker pk: free slots (list)}
+    """
+    workers = list(workers)
+    keys = caching.get_worker_slots_keys([worker.pk for worker in workers], requested_date)
+    available_slots = caching.get_worker_slots(keys)
+
+    missing_workers = [worker for worker in workers if worker.pk not in available_slots]
+    if missing_workers:
+        with measure_availability('slots'), primary_reads():
+            appointments = group_appointments(missing_workers, requested_date, requested_date)
+            schedule_index = get_schedule_index()
+            calculated_slots = {worker.pk: compute_worker_free_slots(worker, requested_date, appointments,
+                                                                     schedule_index)
+                                for worker in missing_workers}
+        caching.set_worker_slots(keys, calculated_slots)
+        available_slots.update(calculated_slots)
+
+    return available_slots
+
+
+def get_range_free_slots(worker: Worker, dates: list, appointments: dict, schedule_index: ScheduleIndex) -> dict:
+    """
+    Calculates free slots of the worker for every date of a range.
+    :param worker: Worker instance
+    :param dates: list of dates
+    :param appointments: appointments grouped by group_appointments()
+    :param schedule_index: ScheduleIndex, see get_schedule_index()
+    :return: dictionary {'YYYY-MM-DD': free slots (list)}
+    """
+    with measure_availability('range'):
+        return {requested_date.isoformat(): compute_worker_free_slots(worker, requested_date, appointments,
+                                                                      schedule_index)
+                for requested_date in dates}
+
+
+def get_dates_range(date_from: date, date_to: date) -> list:
+    """
+    Returns all dates from date_from to date_to (inclusive).
+    """
+    return [date_from + timedelta(days=day) for day in range((date_to - date_from).days + 1)]
+
+
+@measure_availability('earliest')
+def find_earliest_slots(workers: Iterable[Worker], date_from: date, count: int, max_days: int,
+                        locations: Iterable[Location] = None, now: datetime = None) -> list:
+    """
+    Looks for the first free slots among all of the workers, going day by day from date_from.
+    Days on which none of the workers has a schedule are skipped without querying the database,
+    and the search stops as soon as enough slots are found, so its cost depends on how far
+    ahead the free slots are.
+    :param workers: Worker instances
+    :param date_from: first date to look at
+    :param count: number of slots to find
+    :param max_days: number of days to look ahead
+    :param locations: Location instances. If given, only the slots
+                      for which one of the locations is free as well are returned.
+    :param now: current local datetime, slots that start before it are skipped
+    :return: list of dictionaries with date, start_time, end_time, worker and location
+    """
+    workers = list(workers)
+    locations = list(locations) if locations is not None else None
+    schedule_index = get_schedule_index()
+    weekdays = {schedule.weekday for worker in workers for schedule in schedule_index.get_worker_schedules(worker.pk)}
+    if locations is not None:
+        weekdays &= {schedule.weekday for location in locations
+                     for schedule in schedule_index.get_location_schedules(location.pk)}
+
+    found = []
+    for requested_date in get_dates_range(date_from, date_from + timedelta(days=max_days - 1)):
+        if requested_date.weekday() not in weekdays:
+            continue
+
+        appointments = group_appointments(workers, requested_date, requested_date)
+        weekday = requested_date.weekday()
+        earliest_minute = to_minutes(now.time(), round_up=True) if now and now.date() == requested_date else 0
+
+        worker_slots = []
+        for worker in workers:
+            slot_length, buffer_time = get_slot_settings(worker)
+            schedules = schedule_index.get_worker_schedules(worker.pk, weekday)
+            minutes = compute_free_slot_minutes(schedules, appointments.get((worker.pk, requested_date), ()),
+                                                slot_length, buffer_time)
+            worker_slots.append([(minute, worker.pk, slot_length) for minute in minutes if minute >= earliest_minute])
+
+        free_locations = None
+        if locations is not None:
+            location_appointments = defaultdict(list)
+            for appointment in Appointment.objects.filter(location__in=[location.pk for location in locations],
+                                                          date=requested_date).only('location', 'start_time',
+                                                                                    'end_time'):
+                location_appointments[appointment.location_id].append(appointment)
+
+            free_locations = [(location.pk, get_free_minutes(schedule_index.get_location_schedules(location.pk,
+                                                                                                   weekday),
+                                                             location_appointments[location.pk]))
+                              for location in locations]
+
+        for minute, worker_pk, slot_length in heapq.merge(*worker_slots):
+            location_pk = None
+            if free_locations is not None:
+                location_pk = next((pk for pk, free_minutes in free_locations
+                                    if is_free(free_minutes, minute, slot_length)), None)
+                if location_pk is None:
+                    continue
+
+            found.append({'date': requested_date.isoformat(),
+                          'start_time': format_minutes(minute),
+                          'end_time': format_minutes(minute + slot_length),
+                          'worker': worker_pk,
+                          'location': location_pk})
+            if len(found) == count:
+                return found
+
+    return found
@@ -0,0 +1,42 @@
+# Third party imports
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend for several gunicorn workers writing to the same file. Supports the OPTIONS of the
+    SQLite backend of Django 5.1, so it can be replaced with 'django.db.backends.sqlite3' after an upgrade:
+
+    - 'init_command': statements (e.g. "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL"),
+      that are run on every new connection;
+    - 'transaction_mode': 'IMMEDIATE' makes transaction.atomic() take the write lock when it begins.
+      With the default (deferred) transactions, a transaction, that has read and then writes, fails
+      with "database is locked" at once, when another process has written in between, without
+      waiting for 'timeout' seconds (the busy timeout).
+    """
+    def get_connection_params(self) -> dict:
+        kwargs = super(DatabaseWrapper, self).get_connection_params()
+        kwargs.pop('init_command', None)
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"settings.DATABASES 'transaction_mode' must be one of "
+                                       f"{', '.join(TRANSACTION_MODES)}, or None")
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        init_command = self.settings_dict['OPTIONS'].get('init_command')
+        if init_command:
+            for statement in init_command.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if transaction_mode is None:
+            return super(DatabaseWrapper, self)._start_transaction_under_autocommit()
+        self.cursor().execute(f'BEGIN {transaction_mode.upper()}')
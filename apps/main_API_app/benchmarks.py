@@ -0,0 +1,224 @@
+# Standard library imports
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import cycle
+from pathlib import Path
+from typing import Callable
+
+# Third party imports
+from django.contrib.auth.models import Permission, User
+from rest_framework.test import APIClient
+
+# Local app imports
+from . import caching
+from .booking import book_appointment
+from .listing import APPOINTMENT_CONVERTER
+from .models import Location, Worker, Client, Appointment
+from .seeding import AppointmentGenerator, seed_scheduling_data
+from .serializers import AppointmentSerializer, WorkerSerializer
+
+# Size of the generated data set
+BENCHMARK_DATA = {'locations': 100, 'workers': 200, 'clients': 2000, 'appointments': 10000, 'days': 30}
+
+# Number of appointments, that are serialized in the appointment_page_* benchmarks
+PAGE_SIZE = 1000
+
+# Number of booking batches in a round of the booking_throughput benchmark, the first one warms up
+BOOKING_BATCHES = 4
+
+# Fixed work, that doesn't depend on the app's code (see calibrate()). It's measured in every round,
+# and the results are compared with the baseline relative to it, so a slower or busier machine isn't a regression.
+CALIBRATION_DATA = [{'pk': index, 'name': f'Worker {index}', 'slots': [[480 + minute, 495 + minute]
+                                                                      for minute in range(0, 600, 15)]}
+                    for index in range(50)]
+CALIBRATION = 'calibration'
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+
+class Benchmark:
+    """
+    A single measured value.
+    :param name: benchmark name
+    :param unit: unit of the value
+    :param higher_is_better: True for throughput, False for durations
+    """
+    def __init__(self, name: str, unit: str, higher_is_better: bool = False):
+        self.name = name
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def is_regression(self, value: float, baseline: float, tolerance: float) -> bool:
+        if self.higher_is_better:
+            return value < baseline * (1 - tolerance)
+        return value > baseline * (1 + tolerance)
+
+
+BENCHMARKS = (
+    Benchmark('appointment_clean', 'ms'),
+    Benchmark('available_slots', 'ms'),
+    Benchmark('filter_workers_list', 'ms'),
+    Benchmark('appointment_list', 'ms'),
+    Benchmark('client_list', 'ms'),
+    # the same page of appointments, built by AppointmentSerializer and by listing.ValuesConverter
+    Benchmark('appointment_page_serializer', 'ms'),
+    Benchmark('appointment_page_values', 'ms'),
+    Benchmark('booking_throughput', 'bookings/s', higher_is_better=True),
+)
+
+
+def best_duration(func: Callable, repeat: int, setup: Callable = None) -> float:
+    """
+    Calls the function repeat times (after a warm-up call) and returns the shortest duration in milliseconds.
+    Like timeit, the best result is used, because it is the least affected by the other load of the machine.
+    :param func: measured function
+    :param repeat: number of calls
+    :param setup: function, that is called (without being measured) before every call
+    """
+    durations = []
+    for attempt in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        if attempt:
+            durations.append((time.perf_counter() - start) * 1000)
+    return min(durations)
+
+
+def calibrate() -> None:
+    """
+    Serializes fixed data and reads the permissions table, like the benchmarks mostly serialize data and read
+    the database, so the duration follows the speed of the machine for both.
+    """
+    json.loads(json.dumps(CALIBRATION_DATA))
+    list(Permission.objects.order_by('pk').values_list('pk', 'codename', 'name'))
+
+
+def run_benchmarks(repeat: int = 50, bookings: int = 200, rounds: int = 5, seed: int = 0) -> dict:
+    """
+    Generates the data set (see BENCHMARK_DATA) in the current database and runs the benchmarks in rounds.
+    Every round measures each benchmark once (the best of repeat calls), and the median of the rounds is returned,
+    so a burst of other load of the machine changes a few rounds of a benchmark, but not its result.
+    Availability is always calculated from scratch, cached availability is invalidated before every call.
+    :param repeat: number of calls of every measured function in a round
+    :param bookings: number of appointments, booked in the throughput benchmark
+    :param rounds: number of rounds
+    :param seed: random seed
+    :return: dictionary {benchmark name: value}, and the duration of calibrate() in milliseconds
+    """
+    date_from = date.today() + timedelta(days=1)
+    seed_scheduling_data(**BENCHMARK_DATA, seed=seed, date_from=date_from)
+
+    rng = random.Random(seed)
+    workers, locations, clients = list(Worker.objects.all()), list(Location.objects.all()), list(Client.objects.all())
+    generator = AppointmentGenerator(workers, locations, clients, date_from, BENCHMARK_DATA['days'], rng)
+    for appointment in Appointment.objects.all():
+        generator.book(appointment)
+    candidates = [appointment for appointment in (generator.generate() for _ in range(repeat + 1 + bookings))
+                  if appointment]
+
+    api_client = APIClient()
+    api_client.force_authenticate(User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark'))
+    requested_date = (date_from + timedelta(days=2)).isoformat()
+    invalidate_cache = lambda: caching.bump_versions([caching.SCHEDULES_VERSION])
+
+    appointments = Appointment.objects.order_by('date', 'start_time', 'pk')
+    clean_candidates = cycle(candidates[:repeat + 1])
+    slot_workers = cycle(rng.choices(workers, k=repeat + 1))
+
+    # bookings are measured in batches, and the fastest batch of a round is taken
+    booking_candidates = candidates[repeat + 1:]
+    batch_size = max(len(booking_candidates) // (BOOKING_BATCHES * rounds), 1)
+    batches = [booking_candidates[index:index + batch_size]
+               for index in range(0, batch_size * BOOKING_BATCHES * rounds, batch_size)]
+
+    measurements = {
+        CALIBRATION: lambda: best_duration(calibrate, repeat),
+        'appointment_clean': lambda: best_duration(lambda: next(clean_candidates).clean(), repeat),
+        'available_slots': lambda: best_duration(
+            lambda: WorkerSerializer(context={'date': requested_date}).get_available_slots(next(slot_workers)),
+            repeat, invalidate_cache),
+        'filter_workers_list': lambda: best_duration(
+            lambda: api_client.get(f'/filter-specialists/?date={requested_date}&specialty=Therapist'),
+            repeat, invalidate_cache),
+        'appointment_list': lambda: best_duration(
+            lambda: api_client.get(f'/appointments/?from={date_from}&page_size=100'), repeat),
+        'client_list': lambda: best_duration(lambda: api_client.get(f'/clients/?page_size={PAGE_SIZE}'), repeat),
+        'appointment_page_serializer': lambda: best_duration(
+            lambda: AppointmentSerializer(appointments.all()[:PAGE_SIZE], many=True).data, repeat),
+        'appointment_page_values': lambda: best_duration(
+            lambda: APPOINTMENT_CONVERTER.convert(appointments.values_list(*APPOINTMENT_CONVERTER.lookups)[:PAGE_SIZE]),
+            repeat),
+        'booking_throughput': lambda: batch_size / best_duration(
+            lambda: [book_appointment(appointment) for appointment in batches.pop()], BOOKING_BATCHES - 1) * 1000,
+    }
+
+    # the rounds are interleaved, so every benchmark is measured over the whole run
+    values = defaultdict(list)
+    for _ in range(rounds):
+        for name, measure in measurements.items():
+            values[name].append(measure())
+
+    return {name: statistics.median(round_values) for name, round_values in values.items()}
+
+
+def load_baseline(path: Path) -> dict:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: Path, results: dict) -> None:
+    with open(path, 'w') as file:
+        json.dump({name: round(value, 3) for name, value in results.items()}, file, indent=4)
+        file.write('\n')
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> tuple:
+    """
+    Compares the results with the baseline. If both of them have the calibration duration (see calibrate()),
+    the results are scaled by the ratio of the calibration durations first, so they are compared as if
+    they were measured on a machine of the baseline's speed.
+    :param results: dictionary {benchmark name: value}, see run_benchmarks()
+    :param baseline: the same dictionary from a previous run
+    :param tolerance: allowed relative change, e.g. 0.3 for 30%
+    :return: (table rows, names of the regressed benchmarks)
+    """
+    speed = 1.0
+    if results.get(CALIBRATION) and baseline.get(CALIBRATION):
+        speed = baseline[CALIBRATION] / results[CALIBRATION]
+
+    rows, regressions = [], []
+    for benchmark in BENCHMARKS:
+        value, baseline_value = results[benchmark.name], baseline.get(benchmark.name)
+        value = value / speed if benchmark.higher_is_better else value * speed
+        if baseline_value is None:
+            change, status = '', 'new'
+        else:
+            change = f'{(value - baseline_value) / baseline_value:+.1%}'
+            status = 'ok'
+            if benchmark.is_regression(value, baseline_value, tolerance):
+                status = 'REGRESSION'
+                regressions.append(benchmark.name)
+
+        rows.append((benchmark.name, benchmark.unit, '' if baseline_value is None else f'{baseline_value:.2f}',
+                     f'{value:.2f}', change, status))
+
+    return rows, regressions
+
+
+def format_table(rows: list) -> str:
+    header = ('benchmark', 'unit', 'baseline', 'current', 'change', 'status')
+    widths = [max(len(str(row[column])) for row in (header, *rows)) for column in range(len(header))]
+    lines = ['  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip()
+             for row in (header, *rows)]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
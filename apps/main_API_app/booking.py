@@ -0,0 +1,298 @@
+# Standard library imports
+import random
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import Callable
+
+# Third party imports
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, connections, router, transaction
+from django.db.models import Q
+
+# Local app imports
+from . import caching
+from .metrics import record_booking_attempts, record_rejection
+from .models import Worker, Location, Client, Appointment
+from .signals import appointment_versions
+
+# Number of in-process locks the booked resources are spread over, when the database can't lock rows
+LOCK_STRIPES = 64
+
+# How many times a booking is retried, when the database is locked by another writer (SQLite),
+# and the delay before the first retry in seconds. Can be changed with BOOKING settings.
+DEFAULT_BOOKING = {
+    'LOCKED_RETRIES': 10,
+    'LOCKED_RETRY_DELAY': 0.005,
+}
+
+# Error, when the database constraint rejects an overlap, that got past the validation
+OVERLAP_MESSAGE = "Can't book. The specialist or location is already booked at this time"
+
+_stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def get_locked_resources(appointment: Appointment) -> list:
+    """
+    Returns resources that have to be locked while the appointment is booked.
+    The order of models is fixed (worker, location, client), so concurrent bookings can't deadlock.
+    :param appointment: Appointment class instance
+    :return: list of (model, pk) tuples
+    """
+    resources = ((Worker, appointment.worker_id),
+                 (Location, appointment.location_id),
+                 (Client, appointment.client_id))
+
+    return [(model, pk) for model, pk in resources if pk is not None]
+
+
+@contextmanager
+def booking_transaction(resources: list, using: str):
+    """
+    Context manager, that opens a transaction in which only one booking at a time is allowed
+    per worker, location and client. When the database supports row-level locks (PostgreSQL),
+    rows of the resources are locked with SELECT ... FOR UPDATE until the transaction ends.
+    Otherwise (SQLite), the resources are spread over a fixed set of in-process locks, which
+    are held until the transaction is committed, so bookings for unrelated resources
+    rarely wait for each other.
+    :param resources: list of (model, pk) tuples, see get_locked_resources()
+    :param using: database alias
+    """
+    if connections[using].features.has_select_for_update:
+        pks_by_model = defaultdict(set)
+        for model, pk in resources:
+            pks_by_model[model].add(pk)
+
+        with transaction.atomic(using=using):
+            # rows are always locked model by model, in ascending pk order, so transactions can't deadlock
+            for model, pks in pks_by_model.items():
+                list(model.objects.using(using).select_for_update().filter(pk__in=pks).order_by('pk')
+                     .values_list('pk', flat=True))
+            yield
+        return
+
+    stripe_indexes = sorted({zlib.crc32(f'{model._meta.label}:{pk}'.encode()) % LOCK_STRIPES
+                             for model, pk in resources})
+    with ExitStack() as stack:
+        for index in stripe_indexes:
+            stack.enter_context(_stripes[index])
+        with transaction.atomic(using=using):
+            yield
+
+
+def get_booking_settings() -> dict:
+    """
+    Returns BOOKING settings merged with the defaults.
+    """
+    return {**DEFAULT_BOOKING, **getattr(settings, 'BOOKING', {})}
+
+
+def retry_when_locked(write: Callable, before_retry: Callable = None):
+    """
+    Runs the write transaction, and runs it again with exponential backoff (and jitter), while it fails
+    because the database is locked by another writer. SQLite allows only one writer at a time, so bookings
+    of unrelated resources may still collide on the database lock, when the busy timeout runs out.
+    :param write: function, that runs the whole transaction
+    :param before_retry: function, that resets the state changed by the failed attempt
+    :return: result of write()
+    """
+    booking_settings = get_booking_settings()
+    retries = booking_settings['LOCKED_RETRIES']
+
+    for attempt in range(retries + 1):
+        try:
+            return write()
+        except OperationalError as error:
+            if 'locked' not in str(error) or attempt == retries:
+                raise
+            if before_retry is not None:
+                before_retry()
+            time.sleep(booking_settings['LOCKED_RETRY_DELAY'] * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def book_appointment(appointment: Appointment) -> Appointment:
+    """
+    Validates and saves the appointment, while its worker, location and client are locked,
+    so two concurrent bookings can't both pass clean() and overlap.
+    :param appointment: Appointment class instance (new or changed)
+    :return: saved Appointment instance
+    """
+    using = router.db_for_write(Appointment, instance=appointment)
+    resources = get_locked_resources(appointment)
+    adding = appointment._state.adding
+    record_booking_attempts('single')
+
+    def write() -> Appointment:
+        try:
+            with booking_transaction(resources, using):
+                appointment.clean()
+                appointment.save(using=using)
+            return appointment
+
+        except IntegrityError:
+            record_rejection('overlap_constraint')
+            raise ValidationError(OVERLAP_MESSAGE)
+
+    def before_retry() -> None:
+        if adding:
+            appointment.pk = None
+            appointment._state.adding = True
+
+    return retry_when_locked(write, before_retry)
+
+
+def fits_schedule(schedules, appointment_date, start_time, end_time) -> bool:
+    """
+    Checks that one of the (preloaded) schedules covers the time range at the date,
+    the same way as Appointment.clean() does.
+    """
+    weekday = appointment_date.weekday()
+    return any(schedule.weekday == weekday and schedule.from_hour <= start_time and schedule.to_hour >= end_time
+               for schedule in schedules)
+
+
+def overlaps(intervals: list, start_time, end_time) -> bool:
+    """
+    Checks whether the time range overlaps any of the (start, end) intervals.
+    """
+    return any(start < end_time and end > start_time for start, end in intervals)
+
+
+def get_batch_item_errors(item: dict, worker: Worker, location: Location, client: Client,
+                          booked: dict, current_date) -> dict:
+    """
+    Validates a single item of a batch in memory, with the same rules and messages as Appointment.clean().
+    :param item: validated data of a single appointment
+    :param worker: preloaded Worker instance (with prefetched work_schedule) or None
+    :param location: preloaded Location instance (with prefetched work_schedule) or None
+    :param client: preloaded Client instance or None
+    :param booked: booked intervals, {(field, pk, date): [(start_time, end_time), ...]}
+    :param current_date: today
+    :return: errors dictionary, empty if the item is valid
+    """
+    missing = {field: [f'Invalid pk "{item[field]}" - object does not exist.']
+               for field, instance in (('worker', worker), ('location', location), ('client', client))
+               if instance is None}
+    if missing:
+        record_rejection('missing_fields')
+        return missing
+
+    if item['date'] < current_date:
+        record_rejection('past_date')
+        return {'date': ['Date can not be in the past']}
+
+    if item['start_time'] >= item['end_time']:
+        record_rejection('invalid_time_range')
+        return {'end_time': ["Can't book. Procedure end time must occur after start."]}
+
+    for parameter in location, worker:
+        if not fits_schedule(parameter.work_schedule.all(), item['date'], item['start_time'], item['end_time']):
+            record_rejection('schedule_mismatch')
+            return {'date': [f"Can't book. The {parameter} can't be assigned an appointment at this day and time"]}
+
+    conflicts = (('worker', f"Can't book. The {worker} specialist is already booked at this time"),
+                 ('location', f"Can't book. The {location} location is already booked at this time"),
+                 ('client', f"Can't book. The {client} client already has an appointment at this time"))
+    for field, message in conflicts:
+        if overlaps(booked[(field, item[field], item['date'])], item['start_time'], item['end_time']):
+            record_rejection(f'{field}_conflict')
+            return {field: [message]}
+
+    return {}
+
+
+def save_or_reject(appointment: Appointment, using: str):
+    """
+    Saves the appointment in its own savepoint, so a database constraint error rejects only this appointment.
+    :param appointment: validated Appointment instance
+    :param using: database alias
+    :return: saved Appointment instance or an errors dictionary
+    """
+    try:
+        with transaction.atomic(using=using):
+            appointment.save(using=using)
+        return appointment
+
+    except IntegrityError:
+        record_rejection('overlap_constraint')
+        return {'non_field_errors': [OVERLAP_MESSAGE]}
+
+
+def book_appointments(items: list) -> list:
+    """
+    Validates and creates many appointments at once. All of the workers, locations, clients and
+    existing appointments, that are needed for validation, are loaded with a few queries, and
+    every item is validated in memory against them and against the items accepted before it.
+    Valid appointments are inserted with bulk_create() in one transaction, while their
+    resources are locked the same way as in book_appointment(), and it's retried the same way.
+    If the database constraint rejects the batch, it's validated again and the appointments are
+    saved one by one, so only the overlapping ones are rejected.
+    :param items: validated data of AppointmentBulkSerializer (dictionaries with worker, location and client pks)
+    :return: list with a saved Appointment instance or an errors dictionary for every item
+    """
+    record_booking_attempts('bulk', len(items))
+    workers = Worker.objects.prefetch_related('work_schedule').in_bulk({item['worker'] for item in items})
+    locations = Location.objects.prefetch_related('work_schedule').in_bulk({item['location'] for item in items})
+    clients = Client.objects.in_bulk({item['client'] for item in items})
+
+    resources = [(Worker, pk) for pk in sorted(workers)] + [(Location, pk) for pk in sorted(locations)] + \
+                [(Client, pk) for pk in sorted(clients)]
+    using = router.db_for_write(Appointment)
+    current_date = datetime.today().date()
+
+    def book(one_by_one: bool) -> list:
+        results = []
+        with booking_transaction(resources, using):
+            booked = defaultdict(list)
+            existing_appointments = Appointment.objects.using(using)\
+                .filter(Q(worker__in=list(workers)) | Q(location__in=list(locations)) |
+                        Q(client__in=list(clients)), date__in={item['date'] for item in items})\
+                .values_list('worker', 'location', 'client', 'date', 'start_time', 'end_time')
+            for worker_pk, location_pk, client_pk, appointment_date, start_time, end_time in existing_appointments:
+                for field, pk in (('worker', worker_pk), ('location', location_pk), ('client', client_pk)):
+                    booked[(field, pk, appointment_date)].append((start_time, end_time))
+
+            for item in items:
+                worker, location, client = workers.get(item['worker']), locations.get(item['location']), \
+                    clients.get(item['client'])
+
+                errors = get_batch_item_errors(item, worker, location, client, booked, current_date)
+                if errors:
+                    results.append(errors)
+                    continue
+
+                for field in 'worker', 'location', 'client':
+                    booked[(field, item[field], item['date'])].append((item['start_time'], item['end_time']))
+                results.append(Appointment(type=item.get('type'), date=item['date'],
+                                           start_time=item['start_time'], end_time=item['end_time'],
+                                           worker=worker, location=location, client=client))
+
+            if one_by_one:
+                results = [save_or_reject(result, using) if isinstance(result, Appointment) else result
+                           for result in results]
+            else:
+                Appointment.objects.using(using).bulk_create([result for result in results
+                                                              if isinstance(result, Appointment)])
+        return results
+
+    def write() -> list:
+        try:
+            return book(one_by_one=False)
+        except IntegrityError:
+            # the overlap constraint rejected the batch, so it's validated again and saved item by item
+            return book(one_by_one=True)
+
+    results = retry_when_locked(write)
+    appointments = [result for result in results if isinstance(result, Appointment)]
+
+    # bulk_create() doesn't send post_save signals, so cached availability is invalidated here
+    versions = []
+    for appointment in appointments:
+        versions += appointment_versions(appointment.worker_id, appointment.worker.specialty, appointment.date)
+    caching.bump_versions(versions)
+
+    return results
@@ -0,0 +1,263 @@
+# Standard library imports
+import time
+from datetime import date
+from typing import Callable, Iterable
+from urllib.parse import quote
+
+# Third party imports
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Local app imports
+from .routers import primary_reads
+
+# Entries never have to be deleted one by one. Every entry's key contains versions of the data
+# it was calculated from, and model signals (see signals.py) bump these versions, so stale
+# entries just aren't looked up anymore and expire after AVAILABILITY_CACHE['TIMEOUT'].
+# Versions are bumped once again, when the transaction of the change is committed.
+SCHEDULES_VERSION = 'schedules'
+LOCATIONS_VERSION = 'locations'
+# Version of the Schedule table and work_schedule links, see schedules.ScheduleIndex
+SCHEDULE_INDEX_VERSION = 'schedule_index'
+ALL_SPECIALTIES = '*'
+
+STATS_KEYS = {'hits': 'availability:stats:hits', 'misses': 'availability:stats:misses'}
+
+# Backends, that keep a separate cache in every process
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def get_cache():
+    """
+    Returns the cache, that is used for availability data (AVAILABILITY_CACHE['ALIAS'], 'default' by default).
+    """
+    return caches[getattr(settings, 'AVAILABILITY_CACHE', {}).get('ALIAS', 'default')]
+
+
+def is_shared() -> bool:
+    """
+    Checks, that all processes (gunicorn workers) use the same cache. Versions are only reliable in such a cache:
+    in a per-process one (LocMemCache is the default without REDIS_URL) a version, that one worker
+    has bumped, stays the same in the others, and they keep serving their stale entries.
+    So entries of a per-process cache expire after AVAILABILITY_CACHE['LOCAL_TIMEOUT'] (see get_timeout()),
+    and ETags aren't used with it at all.
+    AVAILABILITY_CACHE['SHARED'] overrides the check, e.g. when a single process serves the requests.
+    """
+    shared = getattr(settings, 'AVAILABILITY_CACHE', {}).get('SHARED')
+    if shared is not None:
+        return shared
+    return not isinstance(get_cache(), PROCESS_LOCAL_BACKENDS)
+
+
+def get_timeout() -> int:
+    """
+    Returns how long (in seconds) cached entries are kept: AVAILABILITY_CACHE['TIMEOUT'] in a shared cache,
+    and AVAILABILITY_CACHE['LOCAL_TIMEOUT'] in a per-process one, so changes made through other processes
+    are seen after that time at the latest.
+    """
+    cache_settings = getattr(settings, 'AVAILABILITY_CACHE', {})
+    if is_shared():
+        return cache_settings.get('TIMEOUT', 60 * 60)
+    return cache_settings.get('LOCAL_TIMEOUT', 10)
+
+
+def specialty_version(specialty: str = None) -> str:
+    """
+    Version of the workers of the specialty (of all workers, if specialty is None).
+    """
+    return f'specialty:{quote(specialty.lower()) if specialty else ALL_SPECIALTIES}'
+
+
+def worker_version(worker_pk: int) -> str:
+    """
+    Version of the worker's data and schedules.
+    """
+    return f'worker:{worker_pk}'
+
+
+def day_version(requested_date: date, specialty: str = None) -> str:
+    """
+    Version of the appointments of the specialty (of all specialties, if None) at the date.
+    """
+    return f'day:{requested_date.isoformat()}:{quote(specialty.lower()) if specialty else ALL_SPECIALTIES}'
+
+
+def worker_day_version(worker_pk: int, requested_date: date) -> str:
+    """
+    Version of the worker's appointments at the date.
+    """
+    return f'worker_day:{worker_pk}:{requested_date.isoformat()}'
+
+
+def get_versions(names: list) -> list:
+    """
+    Returns current versions. A missing version (never bumped or evicted) is initialized with
+    a unique value, so entries calculated before the eviction can't be matched again.
+    :param names: version names
+    :return: list of versions in the same order
+    """
+    cache = get_cache()
+    keys = [f'availability:version:{name}' for name in names]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+def increment_versions(names: Iterable[str]) -> None:
+    cache = get_cache()
+    for name in names:
+        key = f'availability:version:{name}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_versions(names: Iterable[str]) -> None:
+    """
+    Invalidates all cached entries, that depend on the given versions. Inside a transaction, the versions
+    are bumped now and once again after the commit: until the commit, other requests still read the old data,
+    and the entries they calculate from it under the new versions mustn't be used after the commit.
+    :param names: version names
+    """
+    names = set(names)
+    increment_versions(names)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: increment_versions(names))
+
+
+def make_key(prefix: str, parts: Iterable, versions: Iterable) -> str:
+    """
+    Builds a cache key from the entry type, the values it is keyed by and data versions.
+    """
+    return ':'.join(['availability', prefix, *map(str, parts), *map(str, versions)])
+
+
+def record_stats(hits: int, misses: int) -> None:
+    """
+    Adds lookups to the hit/miss counters. The counters are kept in the cache itself,
+    so with a shared backend they are common for all processes, and with a per-process one they are per process.
+    """
+    cache = get_cache()
+    for name, count in (('hits', hits), ('misses', misses)):
+        if count:
+            cache.add(STATS_KEYS[name], 0, timeout=None)
+            try:
+                cache.incr(STATS_KEYS[name], count)
+            except ValueError:
+                pass
+
+
+def get_stats() -> dict:
+    """
+    Returns cache hit/miss counters.
+    """
+    stats = get_cache().get_many(STATS_KEYS.values())
+    hits, misses = stats.get(STATS_KEYS['hits'], 0), stats.get(STATS_KEYS['misses'], 0)
+
+    return {'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None}
+
+
+def get_or_set(prefix: str, parts: Iterable, version_names: list, compute: Callable):
+    """
+    Returns a cached value, or calculates and caches it. The value is calculated from the primary
+    database, so that data of a lagging replica isn't cached under the latest versions.
+    :param prefix: entry type
+    :param parts: values the entry is keyed by
+    :param version_names: names of the versions the entry depends on
+    :param compute: function, that calculates the value
+    :return: cached or calculated value
+    """
+    cache = get_cache()
+    key = make_key(prefix, parts, get_versions(version_names))
+
+    value = cache.get(key)
+    if value is not None:
+        record_stats(1, 0)
+        return value
+
+    record_stats(0, 1)
+    with primary_reads():
+        value = compute()
+    cache.set(key, value, get_timeout())
+    return value
+
+
+def get_worker_list(requested_date: date, date_requested: bool, specialty: str, fields: tuple,
+                    compute: Callable) -> list:
+    """
+    Returns cached FilterWorkersView list data for the (date, specialty) pair.
+    :param requested_date: date the slots are calculated for
+    :param date_requested: whether the workers are filtered by the date
+    :param specialty: requested specialty or None
+    :param fields: serialized fields, see serializers.get_selected_fields()
+    :param compute: function, that calculates the list data
+    """
+    return get_or_set('workers', (requested_date.isoformat(), int(date_requested), specialty_version(specialty),
+                                  *fields),
+                      [SCHEDULES_VERSION, specialty_version(specialty), day_version(requested_date, specialty)],
+                      compute)
+
+
+def get_worker_slots_keys(worker_pks: list, requested_date: date) -> dict:
+    """
+    Builds cache keys for the workers' available slots at the date. The keys have to be built
+    before the slots are calculated, so that slots calculated from outdated data can't be
+    stored under the key of the newer version.
+    :param worker_pks: Worker pks
+    :param requested_date: date
+    :return: dictionary {worker pk: key}
+    """
+    version_names = [SCHEDULES_VERSION]
+    for worker_pk in worker_pks:
+        version_names += [worker_version(worker_pk), worker_day_version(worker_pk, requested_date)]
+    versions = get_versions(version_names)
+
+    return {worker_pk: make_key('slots', (worker_pk, requested_date.isoformat()),
+                                (versions[0], *versions[1 + 2 * index:3 + 2 * index]))
+            for index, worker_pk in enumerate(worker_pks)}
+
+
+def get_worker_slots(keys: dict) -> dict:
+    """
+    Returns cached available slots of the workers.
+    :param keys: dictionary {worker pk: key}, see get_worker_slots_keys()
+    :return: dictionary {worker pk: free slots (list)}, only for the cached workers
+    """
+    if not keys:
+        return {}
+    worker_pks = {key: worker_pk for worker_pk, key in keys.items()}
+    cached = {worker_pks[key]: slots for key, slots in get_cache().get_many(worker_pks.keys()).items()}
+
+    record_stats(len(cached), len(keys) - len(cached))
+    return cached
+
+
+def set_worker_slots(keys: dict, slots: dict) -> None:
+    """
+    Caches available slots of the workers.
+    :param keys: dictionary {worker pk: key}, see get_worker_slots_keys()
+    :param slots: dictionary {worker pk: free slots (list)}
+    """
+    if keys:
+        get_cache().set_many({keys[worker_pk]: worker_slots for worker_pk, worker_slots in slots.items()},
+                             get_timeout())
+
+
+def get_location_data(parts: Iterable, compute: Callable):
+    """
+    Returns cached LocationViewSet data.
+    :param parts: values the entry is keyed by (e.g. 'list' or location pk)
+    :param compute: function, that calculates the data
+    """
+    return get_or_set('locations', parts, [SCHEDULES_VERSION, LOCATIONS_VERSION], compute)
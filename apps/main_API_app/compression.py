@@ -0,0 +1,14 @@
+# Third party imports
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class LargeResponseGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware, that compresses only responses of at least GZIP_MIN_LENGTH bytes. Small JSON bodies
+    hardly get smaller, but are compressed on every request. Streaming responses (exports) are always compressed.
+    """
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'GZIP_MIN_LENGTH', 1024):
+            return response
+        return super(LargeResponseGZipMiddleware, self).process_response(request, response)
@@ -0,0 +1,48 @@
+# Standard library imports
+import csv
+import io
+import json
+from typing import Iterator
+
+# Third party imports
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+# Exported fields, the same as in AppointmentSerializer
+EXPORT_FIELDS = ('pk', 'type', 'date', 'start_time', 'end_time', 'worker', 'client', 'location')
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Number of rows fetched from the database cursor and written to the output at once
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_appointments(queryset: QuerySet, file_format: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yields appointments as CSV (with a header) or NDJSON, ordered by date and time. Rows are read
+    with a server-side cursor (where the database supports it) and model instances aren't created,
+    so memory use doesn't depend on the number of appointments.
+    :param queryset: Appointment queryset
+    :param file_format: 'csv' or 'ndjson'
+    :param chunk_size: number of rows in every yielded chunk
+    :return: iterator of text chunks
+    """
+    rows = queryset.order_by('date', 'start_time', 'pk').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    buffer = io.StringIO()
+
+    if file_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        write = writer.writerow
+    else:
+        def write(row: tuple) -> None:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n')
+
+    for index, row in enumerate(rows, 1):
+        write(row)
+        if index % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,142 @@
+# Standard library imports
+import csv
+import io
+import json
+from typing import Type, Union
+
+# Third party imports
+from django.db import transaction
+from rest_framework.serializers import ValidationError
+
+# Local app imports
+from . import caching
+from .models import Location, Worker
+from .schedules import parse_schedules, get_or_create_schedules, invalidate_schedule_index
+from .signals import worker_versions
+
+# Fields, that are imported for every model, besides work_schedule
+IMPORT_FIELDS = {
+    Worker: ('first_name', 'last_name', 'phone', 'specialty'),
+    Location: ('name', 'address'),
+}
+
+
+def parse_rows(content: Union[str, bytes], file_format: str) -> list:
+    """
+    Parses imported rows from CSV or JSON. In CSV, the work_schedule column contains the same
+    JSON list as the work_schedule field of the API, e.g.
+    [{"weekday": "Monday", "from_hour": "09:00", "to_hour": "17:00"}].
+    :param content: file content
+    :param file_format: 'csv' or 'json'
+    :return: list of dictionaries
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    try:
+        if file_format == 'csv':
+            return list(csv.DictReader(io.StringIO(content)))
+        if file_format == 'json':
+            rows = json.loads(content)
+            if isinstance(rows, list):
+                return rows
+    except (csv.Error, ValueError) as error:
+        raise ValidationError({'file': f'The file can not be parsed: {error}'})
+
+    raise ValidationError({'file': 'Expected a list of objects in CSV or JSON format.'})
+
+
+def import_resources(model: Type[Union[Worker, Location]], rows: list) -> dict:
+    """
+    Creates or updates workers or locations with their schedules in bulk. Rows are matched
+    with the existing objects by the model's unique fields. All distinct schedules are resolved
+    at once, and work_schedule of the imported objects is replaced by writing only the added and
+    the removed M2M links in bulk. Objects of rows without work_schedule (or with null) keep their schedules.
+    Nothing is imported, if any of the rows is invalid.
+    :param model: Worker or Location
+    :param rows: list of dictionaries, see parse_rows()
+    :return: dictionary with created, updated and schedules_created counters
+    """
+    fields = IMPORT_FIELDS[model]
+    unique_fields = model._meta.unique_together[0]
+
+    errors, parsed_rows, keys = {}, [], set()
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = {'non_field_errors': ['Expected an object.']}
+            continue
+
+        row_errors = {field: ['This field is required.'] for field in fields if not row.get(field)}
+        # None keeps the current schedules of an existing object
+        schedules = None
+        if row.get('work_schedule') is not None:
+            try:
+                schedules = parse_schedules(row['work_schedule'])
+            except (AttributeError, TypeError, ValueError) as error:
+                row_errors['work_schedule'] = [str(error)]
+
+        key = tuple(row.get(field) for field in unique_fields)
+        if not row_errors and key in keys:
+            row_errors['non_field_errors'] = ['Duplicate row.']
+
+        if row_errors:
+            errors[index] = row_errors
+            continue
+
+        keys.add(key)
+        parsed_rows.append(({field: row[field] for field in fields}, schedules))
+
+    if errors:
+        raise ValidationError({'rows': errors})
+
+    def load_existing() -> dict:
+        existing = model.objects.filter(**{f'{unique_fields[0]}__in': {key[0] for key in keys}})
+        return {tuple(getattr(instance, field) for field in unique_fields): instance for instance in existing}
+
+    with transaction.atomic():
+        schedule_keys = set().union(*(schedules for values, schedules in parsed_rows if schedules is not None))
+        schedules, schedules_created = get_or_create_schedules(schedule_keys)
+
+        existing = load_existing()
+        to_create, to_update = [], []
+        for values, row_schedules in parsed_rows:
+            instance = existing.get(tuple(values[field] for field in unique_fields))
+            if instance is None:
+                to_create.append(model(**values))
+            else:
+                for field, value in values.items():
+                    setattr(instance, field, value)
+                to_update.append(instance)
+
+        model.objects.bulk_create(to_create)
+        model.objects.bulk_update(to_update, fields)
+
+        # bulk_create() doesn't return pks on every database, so the objects are loaded again
+        instances = load_existing()
+
+        # Only the difference with the current links is written, for the rows with work_schedule
+        through = model.work_schedule.through
+        owner_field = f'{model._meta.model_name}_id'
+        scheduled_rows = [(instances[tuple(values[field] for field in unique_fields)].pk, row_schedules)
+                          for values, row_schedules in parsed_rows if row_schedules is not None]
+        requested = {(owner_pk, schedules[schedule_key].pk)
+                     for owner_pk, row_schedules in scheduled_rows for schedule_key in row_schedules}
+        current = {(owner_pk, schedule_pk): pk for pk, owner_pk, schedule_pk in through.objects.filter(
+            **{f'{owner_field}__in': [owner_pk for owner_pk, row_schedules in scheduled_rows]}
+        ).values_list('pk', owner_field, 'schedule_id')}
+
+        through.objects.filter(pk__in=[pk for link, pk in current.items() if link not in requested]).delete()
+        through.objects.bulk_create([through(**{owner_field: owner_pk, 'schedule_id': schedule_pk})
+                                     for owner_pk, schedule_pk in requested - current.keys()])
+        invalidate_schedule_index()
+
+    # bulk operations don't send model signals, so cached data is invalidated here
+    if model is Worker:
+        versions = []
+        for instance in instances.values():
+            versions += worker_versions(instance.pk, instance.specialty)
+        caching.bump_versions(versions)
+    else:
+        caching.bump_versions([caching.LOCATIONS_VERSION])
+
+    return {'created': len(to_create), 'updated': len(to_update), 'schedules_created': schedules_created}
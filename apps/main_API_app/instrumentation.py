@@ -0,0 +1,121 @@
+# Standard library imports
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+# Third party imports
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has, everything else was passed with extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': True,
+    # Requests, that take longer (in milliseconds) or run more queries, are logged
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_REQUEST_QUERIES': 50,
+    # Number of the most repeated queries in the log entry
+    'TOP_QUERIES': 5,
+}
+
+
+def get_instrumentation_settings() -> dict:
+    """
+    Returns REQUEST_INSTRUMENTATION settings merged with the defaults.
+    """
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'REQUEST_INSTRUMENTATION', {})}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as one-line JSON objects, including the fields passed with extra={...}.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'message': record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Makes queries, that differ only in the number of IN (...) parameters, look the same.
+    """
+    return re.sub(r'(%s, )+%s', '%s, ...', sql)
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper, that counts queries and their total time.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[normalize_sql(sql)] += 1
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Measures the number of SQL queries, the time spent in them and the time of the whole view
+    for every request. The numbers are added to the response as Server-Timing header:
+
+        Server-Timing: db;dur=12.3;desc="42 queries", view;dur=45.6
+
+    Requests, that are slower or run more queries than REQUEST_INSTRUMENTATION allows,
+    are logged with their most repeated queries.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.settings = get_instrumentation_settings()
+
+    def __call__(self, request):
+        if not self.settings['ENABLED']:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = (time.perf_counter() - start) * 1000
+        sql_duration = recorder.duration * 1000
+
+        response['Server-Timing'] = f'db;dur={sql_duration:.1f};desc="{recorder.count} queries", ' \
+                                    f'view;dur={duration:.1f}'
+
+        if duration > self.settings['SLOW_REQUEST_MS'] or recorder.count > self.settings['SLOW_REQUEST_QUERIES']:
+            logger.warning('Slow request', extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration, 1),
+                'sql_duration_ms': round(sql_duration, 1),
+                'queries': recorder.count,
+                'repeated_queries': [{'sql': sql, 'count': count}
+                                     for sql, count in recorder.statements.most_common(self.settings['TOP_QUERIES'])
+                                     if count > 1],
+            })
+
+        return response
@@ -0,0 +1,94 @@
+# Standard library imports
+from typing import Iterable
+
+# Third party imports
+from rest_framework import serializers
+
+# Local app imports
+from .models import Schedule
+from .serializers import AppointmentSerializer, ClientSerializer
+
+# DRF fields, whose to_representation() doesn't change the values, that the database returns
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+                   serializers.ReadOnlyField)
+
+
+class ValuesConverter:
+    """
+    Builds list data straight from .values_list() rows, without creating model instances and without
+    calling to_representation() of every DRF field for every row. Values, that the database already
+    returns in their output form (integers, strings, related pks), are copied as they are, and only the
+    other ones go through their converters. The output is the same as the serializer's.
+    :param fields: (output key, values_list() lookup, converter or None) for every field, in the output order
+    """
+    def __init__(self, fields: Iterable[tuple]):
+        self.fields = tuple(fields)
+        self.keys = tuple(key for key, lookup, convert in self.fields)
+        self.lookups = tuple(lookup for key, lookup, convert in self.fields)
+        self.converters = tuple((index, convert) for index, (key, lookup, convert) in enumerate(self.fields)
+                                if convert is not None)
+
+    @classmethod
+    def from_serializer(cls, serializer_class) -> 'ValuesConverter':
+        """
+        Compiles the converter from the fields of a ModelSerializer, that doesn't override to_representation().
+        """
+        fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                fields.append((name, field.source, None))
+            elif isinstance(field, IDENTITY_FIELDS):
+                fields.append((name, field.source, None))
+            elif isinstance(field, (serializers.DateField, serializers.TimeField, serializers.DecimalField)):
+                fields.append((name, field.source, field.to_representation))
+            else:
+                raise TypeError(f'{serializer_class.__name__}.{name} can not be built from values')
+        return cls(fields)
+
+    def select(self, keys: tuple) -> 'ValuesConverter':
+        """
+        Returns the converter for a part of the fields (see serializers.get_selected_fields()).
+        """
+        if keys == self.keys:
+            return self
+        return ValuesConverter(field for field in self.fields if field[0] in keys)
+
+    def get_lookups(self, extra: Iterable[str] = ()) -> tuple:
+        """
+        Returns values_list() lookups, followed by the extra ones (e.g. the ordering fields, that the
+        pagination needs), that aren't output.
+        """
+        return self.lookups + tuple(lookup for lookup in dict.fromkeys(extra) if lookup not in self.lookups)
+
+    def convert(self, rows: Iterable[tuple]) -> list:
+        """
+        :param rows: values_list() rows, that start with the values of self.lookups
+        :return: list of dictionaries
+        """
+        keys, converters = self.keys, self.converters
+        if not converters:
+            return [dict(zip(keys, row)) for row in rows]
+
+        data = []
+        for row in rows:
+            values = list(row)
+            for index, convert in converters:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+            data.append(dict(zip(keys, values)))
+        return data
+
+
+def get_weekday_name(weekday: int) -> str:
+    return Schedule.weekdays[weekday][1]
+
+
+APPOINTMENT_CONVERTER = ValuesConverter.from_serializer(AppointmentSerializer)
+CLIENT_CONVERTER = ValuesConverter.from_serializer(ClientSerializer)
+# ScheduleSerializer has its own to_representation(). Times are left as they are, like there.
+SCHEDULE_CONVERTER = ValuesConverter((('pk', 'pk', None),
+                                      ('weekday', 'weekday', get_weekday_name),
+                                      ('from_hour', 'from_hour', None),
+                                      ('to_hour', 'to_hour', None)))
@@ -0,0 +1,48 @@
+# Standard library imports
+import sys
+from datetime import datetime
+
+# Third party imports
+from django.core.management.base import BaseCommand, CommandError
+
+# Local app imports
+from ...exporting import EXPORT_FORMATS, export_appointments
+from ...models import Appointment
+
+
+def parse_date(value: str):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'time data {value} does not match format %Y-%m-%d')
+
+
+class Command(BaseCommand):
+    help = 'Exports appointments as CSV or NDJSON to a file or to the standard output.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS.keys(), default='csv')
+        parser.add_argument('--from', dest='date_from', type=parse_date, help='First date (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='date_to', type=parse_date, help='Last date (YYYY-MM-DD), inclusive.')
+        parser.add_argument('--worker', type=int, help='Worker pk.')
+        parser.add_argument('--location', type=int, help='Location pk.')
+        parser.add_argument('--output', help='Path to the output file. The standard output by default.')
+
+    def handle(self, *args, **options):
+        queryset = Appointment.objects.all()
+        if options['date_from']:
+            queryset = queryset.filter(date__gte=options['date_from'])
+        if options['date_to']:
+            queryset = queryset.filter(date__lte=options['date_to'])
+        if options['worker']:
+            queryset = queryset.filter(worker=options['worker'])
+        if options['location']:
+            queryset = queryset.filter(location=options['location'])
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in export_appointments(queryset, options['format']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,41 @@
+# Standard library imports
+import json
+import os
+
+# Third party imports
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.serializers import ValidationError
+
+# Local app imports
+from ...importing import parse_rows, import_resources
+from ...models import Worker, Location
+
+MODELS = {'workers': Worker, 'locations': Location}
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates workers or locations with their schedules from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=MODELS.keys())
+        parser.add_argument('path', help='Path to the CSV or JSON file.')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='File format. By default, it is taken from the file extension.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Unknown file format, use --format option.')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                rows = parse_rows(file.read(), file_format)
+            result = import_resources(MODELS[options['resource']], rows)
+        except OSError as error:
+            raise CommandError(error)
+        except ValidationError as error:
+            raise CommandError(json.dumps(error.detail))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created: {result["created"]}, updated: {result["updated"]}, '
+            f'new schedules: {result["schedules_created"]}.'))
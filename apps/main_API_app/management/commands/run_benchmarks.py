@@ -0,0 +1,48 @@
+# Standard library imports
+from pathlib import Path
+
+# Third party imports
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+# Local app imports
+from ...benchmarks import CALIBRATION, DEFAULT_BASELINE, run_benchmarks, load_baseline, save_baseline, \
+    compare_with_baseline, format_table
+
+
+class Command(BaseCommand):
+    help = 'Runs performance benchmarks on generated data in a test database and compares them with the baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Number of calls of every measured function in a round.')
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Number of rounds, the median of the rounds is compared with the baseline.')
+        parser.add_argument('--bookings', type=int, default=200, help='Number of bookings in the throughput test.')
+        parser.add_argument('--tolerance', type=float, default=0.3,
+                            help='Allowed relative regression of the median, 0.3 (30%%) by default.')
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='Path to the baseline file.')
+        parser.add_argument('--update-baseline', action='store_true', help='Saves the results as the new baseline.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = run_benchmarks(options['repeat'], options['bookings'], options['rounds'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        baseline = load_baseline(options['baseline'])
+        rows, regressions = compare_with_baseline(results, baseline, options['tolerance'])
+        self.stdout.write(format_table(rows))
+        if baseline.get(CALIBRATION):
+            self.stdout.write(f'Results are scaled to the speed of the baseline machine: this run calibrated '
+                              f'at {results[CALIBRATION]:.2f} ms, the baseline at {baseline[CALIBRATION]:.2f} ms.')
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {options["baseline"]}'))
+        elif regressions:
+            raise CommandError(f'Performance regressed: {", ".join(regressions)}')
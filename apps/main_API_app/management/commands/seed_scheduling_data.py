@@ -0,0 +1,23 @@
+# Third party imports
+from django.core.management.base import BaseCommand
+
+# Local app imports
+from ...seeding import seed_scheduling_data
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic locations, workers, schedules, clients and appointments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', type=int, default=10)
+        parser.add_argument('--workers', type=int, default=100)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=30, help='Number of days the appointments are spread over.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+
+    def handle(self, *args, **options):
+        created = seed_scheduling_data(options['locations'], options['workers'], options['clients'],
+                                       options['appointments'], options['days'], options['seed'])
+
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{name}: {count}' for name, count in created.items())))
@@ -0,0 +1,122 @@
+# Standard library imports
+import os
+import time
+
+# Third party imports
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest, multiprocess
+
+# Metrics are shared by all gunicorn workers, when PROMETHEUS_MULTIPROC_DIR environment variable
+# points to an (empty on start) directory: every process writes its values to files there, and
+# /metrics aggregates them. See gunicorn.conf.py for the cleanup of exited workers.
+
+DEFAULT_METRICS = {
+    # /metrics responds with 404, when it's False
+    'ENABLED': True,
+    # Clients, that can read the metrics without the token (REMOTE_ADDR)
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    # Other clients have to send "Authorization: Bearer <TOKEN>" header. Nobody else can read the metrics, if None.
+    'TOKEN': None,
+}
+
+VIEW_LATENCY = Histogram(
+    'scheduling_view_duration_seconds', 'Latency of API views.', ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+BOOKING_ATTEMPTS = Counter(
+    'scheduling_booking_attempts_total', 'Appointments, that were tried to be booked.', ['mode'])
+
+BOOKING_REJECTIONS = Counter(
+    'scheduling_booking_rejections_total', 'Appointments, that were rejected, by the failed check.', ['reason'])
+
+AVAILABILITY_DURATION = Gauge(
+    'scheduling_availability_computation_seconds', 'Duration of the last availability computation.',
+    ['operation'], multiprocess_mode='liveall')
+
+
+def record_booking_attempts(mode: str, count: int = 1) -> None:
+    """
+    :param mode: 'single' or 'bulk'
+    :param count: number of appointments
+    """
+    BOOKING_ATTEMPTS.labels(mode).inc(count)
+
+
+def record_rejection(reason: str) -> None:
+    """
+    :param reason: short name of the failed check, see Appointment.rejection()
+    """
+    BOOKING_REJECTIONS.labels(reason).inc()
+
+
+def measure_availability(operation: str):
+    """
+    Context manager, that sets the availability computation gauge of the operation to its duration.
+    :param operation: 'slots', 'range' or 'earliest'
+    """
+    return AVAILABILITY_DURATION.labels(operation).time()
+
+
+def get_metrics_settings() -> dict:
+    """
+    Returns METRICS settings merged with the defaults.
+    """
+    return {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}
+
+
+def get_registry() -> CollectorRegistry:
+    """
+    Returns the registry with the metrics of all processes in multiprocess mode, or of this process otherwise.
+    """
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def can_read_metrics(request, metrics_settings: dict) -> bool:
+    """
+    Checks, that the request comes from one of METRICS['ALLOWED_IPS'] or has METRICS['TOKEN'].
+    """
+    if request.META.get('REMOTE_ADDR') in metrics_settings['ALLOWED_IPS']:
+        return True
+    token = metrics_settings['TOKEN']
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    """
+    Exposes the metrics in Prometheus text format, see METRICS settings.
+    """
+    metrics_settings = get_metrics_settings()
+    if not metrics_settings['ENABLED']:
+        raise Http404
+    if not can_read_metrics(request, metrics_settings):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    Observes the latency of every resolved view. Views are labeled by their URL names,
+    so the number of label values doesn't depend on the requested URLs.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is not None:
+            VIEW_LATENCY.labels(resolver_match.view_name or resolver_match.route, request.method,
+                                response.status_code).observe(time.perf_counter() - start)
+
+        return response
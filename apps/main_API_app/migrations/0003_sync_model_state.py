@@ -0,0 +1,87 @@
+# Generated by Django 4.0.5 on 2026-10-17 02:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0002_appointment_location_alter_location_bookings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='work_schedule',
+            field=models.ManyToManyField(blank=True, to='main_API_app.schedule'),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='locations',
+            field=models.ManyToManyField(blank=True, to='main_API_app.location'),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='workers',
+            field=models.ManyToManyField(blank=True, to='main_API_app.worker'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main_API_app.client'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='end_time',
+            field=models.TimeField(default=django.utils.timezone.localtime),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main_API_app.location'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='start_time',
+            field=models.TimeField(default=django.utils.timezone.localtime),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='type',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='worker',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main_API_app.worker'),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='weekday',
+            field=models.IntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], default='Monday'),
+        ),
+        migrations.AlterField(
+            model_name='worker',
+            name='work_schedule',
+            field=models.ManyToManyField(blank=True, to='main_API_app.schedule'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='location',
+            unique_together={('name', 'address')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='worker',
+            unique_together={('first_name', 'last_name', 'specialty')},
+        ),
+        migrations.RemoveField(
+            model_name='location',
+            name='bookings',
+        ),
+    ]
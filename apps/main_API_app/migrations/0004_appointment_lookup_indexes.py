@@ -0,0 +1,25 @@
+# Generated by Django 4.0.5 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0003_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['worker', 'date', 'start_time'], name='appointment_worker_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['location', 'date', 'start_time'], name='appointment_location_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['client', 'date', 'start_time'], name='appointment_client_date_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Appointments of the same worker or location must not overlap. Boundaries are included,
+# the same way as in Appointment.clean(). PostgreSQL only, other databases rely on booking locks.
+CONSTRAINTS = (
+    ('appointment_worker_no_overlap', 'worker_id'),
+    ('appointment_location_no_overlap', 'location_id'),
+)
+
+
+def check_overlaps(schema_editor, table: str, column: str, bounds: str) -> None:
+    """
+    Refuses to add the constraint, while existing appointments of the same worker or location overlap,
+    and lists the first of them, so they can be moved or deleted before the migration runs again.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT a.id, b.id FROM {table} a JOIN {table} b '
+            f'ON a.{column} = b.{column} AND a.date = b.date AND a.id < b.id '
+            f'AND tsrange(a.date + a.start_time, a.date + a.end_time, \'{bounds}\') '
+            f'&& tsrange(b.date + b.start_time, b.date + b.end_time, \'{bounds}\') ORDER BY 1, 2 LIMIT 20'
+        )
+        pairs = cursor.fetchall()
+    if pairs:
+        raise RuntimeError(f'Appointments with the same {column} overlap, move or delete them first: '
+                           + ', '.join(f'{first} and {second}' for first, second in pairs))
+
+
+def add_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    table = schema_editor.quote_name(apps.get_model('main_API_app', 'Appointment')._meta.db_table)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in CONSTRAINTS:
+        check_overlaps(schema_editor, table, column, '[]')
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist '
+            f'({column} WITH =, tsrange(date + start_time, date + end_time, \'[]\') WITH &&)'
+        )
+
+
+def remove_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    table = schema_editor.quote_name(apps.get_model('main_API_app', 'Appointment')._meta.db_table)
+    for name, column in CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0004_appointment_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraints, remove_constraints),
+    ]
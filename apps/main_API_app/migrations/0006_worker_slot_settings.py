@@ -0,0 +1,23 @@
+# Generated by Django 4.0.5 on 2026-10-17 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0005_appointment_no_overlap_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worker',
+            name='buffer_time',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Break between appointments in minutes. If empty, the specialty or default setting from APPOINTMENT_SLOTS is used.', null=True),
+        ),
+        migrations.AddField(
+            model_name='worker',
+            name='slot_length',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Slot length in minutes. If empty, the specialty or default setting from APPOINTMENT_SLOTS is used.', null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Availability is calculated in minutes now, so appointments that only touch each other
+# (one ends when the next one starts) are allowed, the same way as in Appointment.clean().
+CONSTRAINTS = (
+    ('appointment_worker_no_overlap', 'worker_id'),
+    ('appointment_location_no_overlap', 'location_id'),
+)
+
+
+def check_overlaps(schema_editor, table: str, column: str, bounds: str) -> None:
+    """
+    Refuses to add the constraint, while existing appointments of the same worker or location overlap,
+    and lists the first of them, so they can be moved or deleted before the migration runs again.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT a.id, b.id FROM {table} a JOIN {table} b '
+            f'ON a.{column} = b.{column} AND a.date = b.date AND a.id < b.id '
+            f'AND tsrange(a.date + a.start_time, a.date + a.end_time, \'{bounds}\') '
+            f'&& tsrange(b.date + b.start_time, b.date + b.end_time, \'{bounds}\') ORDER BY 1, 2 LIMIT 20'
+        )
+        pairs = cursor.fetchall()
+    if pairs:
+        raise RuntimeError(f'Appointments with the same {column} overlap, move or delete them first: '
+                           + ', '.join(f'{first} and {second}' for first, second in pairs))
+
+
+def replace_constraints(bounds):
+    def replace(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+
+        table = schema_editor.quote_name(apps.get_model('main_API_app', 'Appointment')._meta.db_table)
+        for name, column in CONSTRAINTS:
+            check_overlaps(schema_editor, table, column, bounds)
+            schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+            schema_editor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist '
+                f'({column} WITH =, tsrange(date + start_time, date + end_time, \'{bounds}\') WITH &&)'
+            )
+
+    return replace
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0006_worker_slot_settings'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_constraints('[)'), replace_constraints('[]')),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_API_app', '0007_appointment_half_open_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'start_time', 'id'], name='appointment_keyset_idx'),
+        ),
+    ]
@@ -1,5 +1,24 @@
+# Standard library imports
+import hashlib
+import os
+from datetime import datetime
+
 # Third party imports
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.serializers import ValidationError
+
+# Local app imports
+from . import caching
+from .availability import get_available_slots_map
+from .importing import parse_rows, import_resources
+from .routers import disable_replica_reads
+from .serializers import get_selected_fields, restrict_queryset
 
 
 class SuperuserRequiredMixin(UserPassesTestMixin):
@@ -8,3 +27,165 @@ class SuperuserRequiredMixin(UserPassesTestMixin):
     """
     def test_func(self) -> bool:
         return self.request.user.is_superuser
+
+
+class SparseFieldsMixin:
+    """
+    Mixin for views with SparseFieldsSerializerMixin serializers. If some fields are excluded with
+    'fields' or 'omit' query parameters, only the model fields, that the selected fields need, are loaded
+    with .only(), and many-to-many fields are prefetched only if they are selected.
+    """
+    def get_selected_fields(self) -> tuple:
+        return get_selected_fields(self.request, self.get_serializer_class().Meta.fields)
+
+    def filter_queryset(self, queryset):
+        queryset = super(SparseFieldsMixin, self).filter_queryset(queryset)
+        # the pagination reads the ordering fields of the last row
+        return restrict_queryset(queryset, self.get_serializer_class(), self.get_selected_fields(),
+                                 getattr(self, 'keyset_ordering', ('pk',)))
+
+
+class ValuesListMixin:
+    """
+    Mixin for list views, whose serializers only copy model fields. The list is built from
+    .values_list() rows by values_converter (see listing.ValuesConverter) instead of serializing
+    model instances, with the same output. Selected fields (see SparseFieldsMixin) are respected.
+    """
+    values_converter = None
+
+    def list(self, request, *args, **kwargs):
+        converter = self.values_converter
+        if hasattr(self, 'get_selected_fields'):
+            converter = converter.select(self.get_selected_fields())
+
+        # the pagination reads the ordering fields of the last row by their names
+        ordering = getattr(self, 'keyset_ordering', None) or getattr(self.paginator, 'ordering', ())
+        rows = self.filter_queryset(self.get_queryset()).values_list(*converter.get_lookups(ordering), named=True)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(converter.convert(page))
+        return Response(converter.convert(rows))
+
+
+class AvailableSlotsMixin:
+    """
+    Mixin for Worker list views. Calculates available slots of all listed workers at once,
+    instead of querying schedules and appointments for every worker in the serializer.
+    The workers should come with prefetched work_schedule.
+    """
+    requested_date = None
+
+    def get_list_data(self, workers) -> list:
+        """
+        Serializes the listed workers.
+        :param workers: Worker instances or queryset
+        :return: list
+        """
+        workers = list(workers)
+        requested_date = self.requested_date or datetime.today().date()
+
+        context = self.get_serializer_context()
+        if 'available_slots' in get_selected_fields(self.request, self.get_serializer_class().Meta.fields):
+            context.update({'available_slots': get_available_slots_map(workers, requested_date)})
+        return self.get_serializer(workers, many=True, context=context).data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_list_data(page))
+        return Response(self.get_list_data(queryset))
+
+
+class ResourceImportMixin:
+    """
+    Mixin for Worker and Location viewsets. Adds import/ endpoint, that creates or updates
+    many objects with their schedules at once, see importing.import_resources().
+    """
+    # The largest number of rows, that can be imported with a single request
+    max_import_size = 10000
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request, *args, **kwargs):
+        """
+        Accepts a JSON list of objects or a CSV/JSON file, uploaded as 'file' field.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = os.path.splitext(upload.name)[1].lstrip('.').lower()
+            if file_format not in ('csv', 'json'):
+                raise ValidationError({'file': 'Only .csv and .json files are supported.'})
+            rows = parse_rows(upload.read(), file_format)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            raise ValidationError({'non_field_errors': 'Expected a list of objects or a CSV/JSON file.'})
+
+        if len(rows) > self.max_import_size:
+            raise ValidationError({'non_field_errors': f'Up to {self.max_import_size} rows can be imported at once.'})
+
+        return Response(import_resources(self.get_queryset().model, rows), status=status.HTTP_201_CREATED)
+
+
+class NotModified(APIException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """
+    Compares the ETag with If-None-Match header the weak way (W/"x" matches "x"), like Django does.
+    """
+    tags = parse_etags(if_none_match)
+    return tags == ['*'] or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+class ConditionalGetMixin:
+    """
+    Mixin for list and retrieve views, whose data changes only along with the versions of caching.py,
+    that model signals bump. Responses get an ETag, built from the request and the current versions,
+    so it's calculated with a single cache lookup. If If-None-Match has the same ETag, 304 Not Modified
+    is returned right after authentication and permission checks, without running the queryset or
+    the serializers. ETags are only used with a shared cache, see caching.is_shared(). Their data is read
+    from the primary database, so the views don't read from a replica (see ReplicaReadsMixin) with a shared cache.
+    Views have to define get_etag_versions(), that returns names of the versions, the data of the current
+    action depends on. It's checked, when the view class is defined.
+    """
+    etag = None
+
+    def __init_subclass__(cls, **kwargs):
+        super(ConditionalGetMixin, cls).__init_subclass__(**kwargs)
+        if not callable(getattr(cls, 'get_etag_versions', None)):
+            raise ImproperlyConfigured(f'{cls.__name__} has to define get_etag_versions()')
+
+    def get_etag(self, request) -> str:
+        names = self.get_etag_versions()
+        parts = (request.get_full_path(), request.accepted_renderer.format, *names, *caching.get_versions(names))
+        return f'W/"{hashlib.sha1(repr(parts).encode()).hexdigest()}"'
+
+    def initial(self, request, *args, **kwargs):
+        super(ConditionalGetMixin, self).initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or self.action not in ('list', 'retrieve'):
+            return
+        # with a per-process cache, other processes don't see the bumped versions
+        if not caching.is_shared():
+            return
+
+        # versions are read before the data, so the ETag may only be older than the data, never newer.
+        # The data is read from the primary database, a lagging replica would be cached under the new ETag.
+        self.etag = self.get_etag(request)
+        disable_replica_reads()
+        if etag_matches(self.etag, request.headers.get('If-None-Match', '')):
+            raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super(ConditionalGetMixin, self).handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ConditionalGetMixin, self).finalize_response(request, response, *args, **kwargs)
+        if self.etag is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = self.etag
+        return response
@@ -1,11 +1,18 @@
 # Standard library imports
+import logging
 from datetime import datetime
 
 # Third party imports
 import django.utils.timezone
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, ObjectDoesNotExist
+from django.db import connections, models, router
+from django.db.models import ObjectDoesNotExist
+
+# Local app imports
+from .metrics import record_rejection
+from .routers import primary_reads
+
+logger = logging.getLogger(__name__)
 
 
 class Schedule(models.Model):
@@ -64,6 +71,13 @@ class Worker(models.Model):
     phone = models.CharField(max_length=100)
     specialty = models.CharField(max_length=100)
     work_schedule = models.ManyToManyField(Schedule, blank=True)
+    slot_length = models.PositiveSmallIntegerField(blank=True, null=True,
+                                                   help_text='Slot length in minutes. If empty, the specialty '
+                                                             'or default setting from APPOINTMENT_SLOTS is used.')
+    buffer_time = models.PositiveSmallIntegerField(blank=True, null=True,
+                                                   help_text='Break between appointments in minutes. If empty, the '
+                                                             'specialty or default setting from APPOINTMENT_SLOTS '
+                                                             'is used.')
 
     class Meta:
         unique_together = ('first_name', 'last_name', 'specialty')
@@ -96,86 +110,109 @@ class Appointment(models.Model):
     client = models.ForeignKey('Client', on_delete=models.CASCADE, blank=True, null=True)
     location = models.ForeignKey('Location', on_delete=models.CASCADE, blank=True, null=True)
 
-    def get_hour(self, option: str) -> str:
-        if option == 'start':
-            hour = self.start_time.hour
-
-        elif option == 'end':
-            hour = self.end_time.hour
-            minutes = self.end_time.minute
-
-            if minutes >= 10:
-                hour += 1
-        else:
-            raise ValidationError('Wrong parameter "option". Try "start" or "end".')
-
-        return hour
+    class Meta:
+        indexes = [
+            models.Index(fields=('worker', 'date', 'start_time'), name='appointment_worker_date_idx'),
+            models.Index(fields=('location', 'date', 'start_time'), name='appointment_location_date_idx'),
+            models.Index(fields=('client', 'date', 'start_time'), name='appointment_client_date_idx'),
+            models.Index(fields=('date', 'start_time', 'id'), name='appointment_keyset_idx'),
+        ]
+
+    def rejection(self, reason: str, message) -> ValidationError:
+        """
+        Logs why the appointment can't be booked and returns the error to raise.
+        :param reason: short name of the failed check, e.g. 'worker_conflict'
+        :param message: ValidationError message
+        :return: ValidationError
+        """
+        record_rejection(reason)
+        logger.debug('Appointment rejected', extra={'reason': reason, 'date': self.date,
+                                                    'start_time': self.start_time, 'end_time': self.end_time,
+                                                    'worker': self.worker_id, 'location': self.location_id,
+                                                    'client': self.client_id})
+        return ValidationError(message)
+
+    def get_booking_checks(self) -> tuple:
+        """
+        Runs the schedule and conflict checks of clean() as a single statement on the primary database.
+        Building the same query with the ORM (five EXISTS subqueries) takes several times longer
+        than running it, and it runs for every booking.
+        :return: (location_schedule, worker_schedule, worker_conflict, location_conflict, client_conflict) booleans
+        """
+        with primary_reads():
+            connection = connections[router.db_for_read(Appointment, instance=self)]
+        operations = connection.ops
+        schedule_table = operations.quote_name(Schedule._meta.db_table)
+        appointment_table = operations.quote_name(Appointment._meta.db_table)
+        date, start_time, end_time = operations.adapt_datefield_value(self.date), \
+            operations.adapt_timefield_value(self.start_time), operations.adapt_timefield_value(self.end_time)
+
+        def schedule_match(model, owner: str, pk) -> tuple:
+            links_table = operations.quote_name(model.work_schedule.through._meta.db_table)
+            return (f'EXISTS(SELECT 1 FROM {schedule_table} s JOIN {links_table} o ON o.schedule_id = s.id '
+                    f'WHERE o.{owner}_id = %s AND s.weekday = %s AND s.from_hour <= %s AND s.to_hour >= %s)',
+                    [pk, self.date.weekday(), start_time, end_time])
+
+        def conflict(field: str, pk) -> tuple:
+            # like .filter(client=None), an appointment without the field conflicts with the others without it
+            sql = f'EXISTS(SELECT 1 FROM {appointment_table} a WHERE a.{field}_id IS NULL' if pk is None else \
+                f'EXISTS(SELECT 1 FROM {appointment_table} a WHERE a.{field}_id = %s'
+            params = [] if pk is None else [pk]
+            sql += ' AND a.date = %s AND a.start_time < %s AND a.end_time > %s'
+            params += [date, end_time, start_time]
+            if self.pk is not None:
+                sql += ' AND a.id <> %s'
+                params.append(self.pk)
+            return sql + ')', params
+
+        checks = [schedule_match(Location, 'location', self.location_id),
+                  schedule_match(Worker, 'worker', self.worker_id),
+                  conflict('worker', self.worker_id), conflict('location', self.location_id),
+                  conflict('client', self.client_id)]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT ' + ', '.join(sql for sql, params in checks),
+                           [param for sql, params in checks for param in params])
+            return tuple(map(bool, cursor.fetchone()))
 
     def clean(self):
         try:
             # check that date is not in the past
             current_date = datetime.today().date()
             if self.date < current_date:
-                raise ValidationError({'date': f'Date can not be in the past'})
+                raise self.rejection('past_date', {'date': f'Date can not be in the past'})
 
             # check that start is before finish
             if self.start_time >= self.end_time:
-                raise ValidationError({"end_time": f"Can't book. Procedure end time must occur after start."})
-
-            # check if location and worker can be booked at certain day and time range
-            for parameter in self.location, self.worker:
-                schedule_match = False
-
-                if parameter is self.location:
-                    schedules_for_checking = Schedule.objects.filter(location=self.location)
-                    print(schedules_for_checking)
-                else:
-                    schedules_for_checking = Schedule.objects.filter(worker=self.worker)
-
-                current_weekday = self.date.weekday()
+                raise self.rejection('invalid_time_range',
+                                     {"end_time": f"Can't book. Procedure end time must occur after start."})
 
-                for schedule in schedules_for_checking:
-                    condition = all((schedule.weekday == current_weekday,
-                                     schedule.from_hour <= self.start_time < schedule.to_hour,
-                                     schedule.from_hour < self.end_time <= schedule.to_hour
-                                     ))
-                    print(schedule.weekday == current_weekday)
-                    print(schedule.weekday)
-                    print(schedule.from_hour <= self.start_time < schedule.to_hour)
-                    print(schedule.from_hour < self.end_time <= schedule.to_hour)
+            if self.location_id is None or self.worker_id is None:
+                raise self.rejection('missing_fields', 'Please, fill all of the fields.')
 
-                    if condition:
-                        schedule_match = True
+            # check if location and worker can be booked at certain day and time range, and that location, worker
+            # and client are not already booked at this time (on the primary database, schedules may have
+            # just been changed, and a replica may not have the latest bookings yet)
+            location_schedule, worker_schedule, worker_conflict, location_conflict, client_conflict = \
+                self.get_booking_checks()
 
+            for parameter, schedule_match in (('location', location_schedule), ('worker', worker_schedule)):
                 if not schedule_match:
-                    raise ValidationError({"date": f"Can't book. The {parameter} can't be assigned an appointment"
-                                                                         f" at this day and time"})
-
-            # check if location and worker are not already booked at certain day and time
-            similar_appointments = Appointment.objects.filter(Q(date=self.date),
-                                                              Q(start_time__lte=self.start_time,
-                                                                end_time__gte=self.start_time) |
-                                                              Q(start_time__lte=self.end_time,
-                                                                end_time__gte=self.end_time) |
-                                                              Q(start_time__range=(self.start_time, self.end_time)) |
-                                                              Q(end_time__range=(self.start_time, self.end_time))
-                                                              )
-            print(similar_appointments)
-            if similar_appointments.exists():
-                for appointment in similar_appointments:
-                    if appointment.pk != self.pk:
-                        if self.worker == appointment.worker:
-                            raise ValidationError({"worker": f"Can't book. The {self.worker} specialist is"
-                                                                         f" already booked at this time"})
-                        if self.location == appointment.location:
-                            raise ValidationError({"location": f"Can't book. The {self.location} location is"
-                                                             f" already booked at this time"})
-                        if self.client == appointment.client:
-                            raise ValidationError({"client": f"Can't book. The {self.client} client already has"
-                                                             f" an appointment at this time"})
+                    raise self.rejection('schedule_mismatch',
+                                         {"date": f"Can't book. The {getattr(self, parameter)} can't be assigned"
+                                                  f" an appointment at this day and time"})
+
+            if worker_conflict:
+                raise self.rejection('worker_conflict', {"worker": f"Can't book. The {self.worker} specialist"
+                                                                   f" is already booked at this time"})
+            if location_conflict:
+                raise self.rejection('location_conflict', {"location": f"Can't book. The {self.location}"
+                                                                       f" location is already booked at this time"})
+            if client_conflict:
+                raise self.rejection('client_conflict', {"client": f"Can't book. The {self.client} client"
+                                                                   f" already has an appointment at this time"})
 
         except ObjectDoesNotExist:
-            raise ValidationError('Please, fill all of the fields.')
+            raise self.rejection('missing_fields', 'Please, fill all of the fields.')
 
     def __str__(self):
         return f'{self.type} ({self.client})'
@@ -0,0 +1,113 @@
+# Standard library imports
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date, time
+from functools import reduce
+from operator import or_
+
+# Third party imports
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination by all of the ordering fields (keyset pagination). Unlike offset or
+    DRF's CursorPagination, the next page is selected with a WHERE condition on the values of
+    the last returned row, so with a matching index every page costs the same as the first one.
+    The ordering is taken from the view's keyset_ordering attribute, ('pk',) by default.
+    The fields must be ascending, and the last one must be unique.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(cursor))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_values = self.get_values(page[-1]) if page else None
+
+        return page
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_keyset_filter(self, values: list) -> Q:
+        """
+        Builds (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ... condition.
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            equal = {previous_field: values[position] for position, previous_field in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal, **{f'{field}__gt': values[index]}))
+        return reduce(or_, conditions)
+
+    def get_values(self, instance) -> list:
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field)
+            values.append(value.isoformat() if isinstance(value, (date, time)) else value)
+        return values
+
+    def encode_cursor(self, values: list) -> str:
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
@@ -0,0 +1,146 @@
+# Standard library imports
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Third party imports
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+DEFAULT_READ_REPLICA = {
+    # Database alias of the replica. Reads go to 'default', while the alias isn't in DATABASES.
+    'ALIAS': 'replica',
+    # How long (in seconds) a client reads from the primary after a write, so it sees its own changes
+    'STICKY_SECONDS': 10,
+    # Name of the cookie, that keeps the client on the primary
+    'COOKIE': 'read_primary',
+}
+
+
+def get_replica_settings() -> dict:
+    """
+    Returns READ_REPLICA settings merged with the defaults.
+    """
+    return {**DEFAULT_READ_REPLICA, **getattr(settings, 'READ_REPLICA', {})}
+
+
+def get_replica_alias():
+    """
+    :return: alias of the configured replica or None
+    """
+    alias = get_replica_settings()['ALIAS']
+    return alias if alias and alias != DEFAULT_DB_ALIAS and alias in settings.DATABASES else None
+
+
+class RoutingState:
+    """
+    Database routing state of a single request, see ReplicaRoutingMiddleware.
+    :param pinned: whether the client has written recently, so it reads from the primary
+    """
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+    def uses_replica(self) -> bool:
+        return self.replica_reads and not self.pinned and not self.wrote
+
+
+# Routing state of the current request (None outside of requests, so everything reads from the primary).
+current_state = ContextVar('database_routing_state', default=None)
+# Set by primary_reads(), for reads, that must see the latest data
+reading_primary = ContextVar('reading_primary', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Context manager, in which all reads go to the primary: booking conflict checks and data, that
+    is cached under versions (see caching.py), so a lagging replica can't be cached as the latest data.
+    """
+    token = reading_primary.set(True)
+    try:
+        yield
+    finally:
+        reading_primary.reset(token)
+
+
+def enable_replica_reads() -> None:
+    """
+    Sends the rest of the current request's reads to the replica (unless the client is pinned to the primary).
+    """
+    state = current_state.get()
+    if state is not None:
+        state.replica_reads = True
+
+
+def disable_replica_reads() -> None:
+    """
+    Sends the rest of the current request's reads back to the primary.
+    """
+    state = current_state.get()
+    if state is not None:
+        state.replica_reads = False
+
+
+class ReplicaRouter:
+    """
+    Sends reads of read-only requests of ReplicaReadsMixin views to the READ_REPLICA database,
+    and everything else to 'default'. A request stops reading from the replica as soon as it writes,
+    and the client reads from the primary for READ_REPLICA['STICKY_SECONDS'] after that.
+    """
+    def db_for_read(self, model, **hints):
+        if reading_primary.get():
+            return DEFAULT_DB_ALIAS
+        state = current_state.get()
+        if state is None or not state.replica_reads:
+            return None
+        # instances, that were read from the replica, don't pull their relations from it after a write
+        return (get_replica_alias() if state.uses_replica() else None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same data as the primary
+        aliases = {DEFAULT_DB_ALIAS, get_replica_settings()['ALIAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadsMixin:
+    """
+    Mixin for list and retrieve views. After authentication, reads of GET and HEAD requests
+    go to the replica, see ReplicaRouter.
+    """
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadsMixin, self).initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            enable_replica_reads()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Keeps the routing state of the request (see ReplicaRouter) and pins the client to the primary
+    with a short-living cookie after a request, that has written to the database ("read your writes").
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.settings = get_replica_settings()
+
+    def __call__(self, request):
+        state = RoutingState(pinned=self.settings['COOKIE'] in request.COOKIES)
+        token = current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(self.settings['COOKIE'], '1', max_age=self.settings['STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
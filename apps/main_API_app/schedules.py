@@ -0,0 +1,219 @@
+# Standard library imports
+import json
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Union
+
+# Third party imports
+from django.db import transaction
+from django.utils.dateparse import parse_time
+
+# Local app imports
+from . import caching
+from .models import Location, Worker, Schedule
+from .routers import primary_reads
+
+WEEKDAYS = {
+    'monday': 0,
+    'tuesday': 1,
+    'wednesday': 2,
+    'thursday': 3,
+    'friday': 4,
+    'saturday': 5,
+    'sunday': 6
+}
+
+
+class ScheduleIndex:
+    """
+    In-memory copy of the Schedule table and of the work_schedule links of workers and locations.
+    The table is small and rarely changes, but is read on almost every request, so every process
+    keeps an index of it (see get_schedule_index()). Schedule instances are shared between
+    the callers and must not be modified.
+    """
+    def __init__(self, version, schedules: list, worker_links: list, location_links: list):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.schedules = {schedule.pk: schedule for schedule in schedules}
+        self.by_key = {(schedule.weekday, schedule.from_hour, schedule.to_hour): schedule for schedule in schedules}
+
+        self.by_weekday = defaultdict(list)
+        for schedule in sorted(schedules, key=lambda schedule: (schedule.from_hour, schedule.pk)):
+            self.by_weekday[schedule.weekday].append(schedule)
+
+        self.worker_schedules = defaultdict(list)
+        self.weekday_workers = defaultdict(set)
+        for worker_pk, schedule_pk in worker_links:
+            schedule = self.schedules[schedule_pk]
+            self.worker_schedules[worker_pk].append(schedule)
+            self.weekday_workers[schedule.weekday].add(worker_pk)
+
+        self.location_schedules = defaultdict(list)
+        for location_pk, schedule_pk in location_links:
+            self.location_schedules[location_pk].append(self.schedules[schedule_pk])
+
+    @classmethod
+    def load(cls, version) -> 'ScheduleIndex':
+        # the index is kept until the version changes, so it's loaded from the primary database
+        with primary_reads():
+            return cls(version,
+                       list(Schedule.objects.all()),
+                       list(Worker.work_schedule.through.objects.values_list('worker_id', 'schedule_id')),
+                       list(Location.work_schedule.through.objects.values_list('location_id', 'schedule_id')))
+
+    def is_outdated(self, version, max_age: float = None) -> bool:
+        """
+        Checks whether the index was loaded for another version, or more than max_age seconds ago.
+        """
+        return self.version != version or (max_age is not None and time.monotonic() - self.loaded_at > max_age)
+
+    def get_worker_schedules(self, worker_pk: int, weekday: int = None) -> list:
+        """
+        Returns schedules of the worker, only for the weekday if it is given.
+        """
+        return [schedule for schedule in self.worker_schedules.get(worker_pk, ())
+                if weekday is None or schedule.weekday == weekday]
+
+    def get_location_schedules(self, location_pk: int, weekday: int = None) -> list:
+        """
+        Returns schedules of the location, only for the weekday if it is given.
+        """
+        return [schedule for schedule in self.location_schedules.get(location_pk, ())
+                if weekday is None or schedule.weekday == weekday]
+
+    def get_weekday_worker_pks(self, weekday: int) -> set:
+        """
+        Returns pks of the workers, that have a schedule for the weekday.
+        """
+        return self.weekday_workers.get(weekday, set())
+
+
+_index = None
+_index_lock = threading.Lock()
+_local = threading.local()
+
+
+def has_uncommitted_changes() -> bool:
+    """
+    Checks whether the current transaction has changed schedules (see invalidate_schedule_index()).
+    Only weak references to the commit callbacks are kept, and the connection drops the callbacks
+    of a transaction or a savepoint, when it is committed or rolled back.
+    """
+    return bool(getattr(_local, 'pending', None))
+
+
+def get_schedule_index() -> ScheduleIndex:
+    """
+    Returns the ScheduleIndex. The process keeps its index and reloads it (with 3 queries), when
+    SCHEDULE_INDEX_VERSION in the cache has changed. With a shared cache (see caching.is_shared()) all processes
+    see the same version. A per-process cache only sees the changes of its own process, so the index is also
+    reloaded, when it's older than the timeout of the cache (see caching.get_timeout()). While the current
+    transaction has uncommitted schedule changes, a new index is loaded on every call.
+    """
+    global _index
+    if has_uncommitted_changes():
+        return ScheduleIndex.load(None)
+
+    version = caching.get_versions([caching.SCHEDULE_INDEX_VERSION])[0]
+    max_age = None if caching.is_shared() else caching.get_timeout()
+    index = _index
+    if index is None or index.is_outdated(version, max_age):
+        with _index_lock:
+            index = _index
+            if index is None or index.is_outdated(version, max_age):
+                index = _index = ScheduleIndex.load(version)
+
+    return index
+
+
+def invalidate_schedule_index() -> None:
+    """
+    Makes all processes reload their ScheduleIndex, once the current transaction is committed.
+    """
+    def bump_version() -> None:
+        caching.bump_versions([caching.SCHEDULE_INDEX_VERSION])
+
+    if getattr(_local, 'pending', None) is None:
+        _local.pending = weakref.WeakSet()
+    _local.pending.add(bump_version)
+    transaction.on_commit(bump_version)
+
+
+def parse_schedules(value) -> set:
+    """
+    Parses work_schedule data of a Worker or a Location.
+    :param value: dictionary with weekday, from_hour and to_hour, a list of them or its JSON string
+    :return: set of (weekday, from_hour, to_hour) tuples
+    """
+    if value in (None, ''):
+        return set()
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        value = [value]
+
+    schedules = set()
+    for schedule in value:
+        weekday = WEEKDAYS.get(str(schedule.get('weekday')).lower())
+        from_hour = parse_time(str(schedule.get('from_hour')))
+        to_hour = parse_time(str(schedule.get('to_hour')))
+        if weekday is None or from_hour is None or to_hour is None or from_hour >= to_hour:
+            raise ValueError(f'Invalid schedule: {schedule}')
+        schedules.add((weekday, from_hour, to_hour))
+
+    return schedules
+
+
+def count_schedules(schedule_keys: set) -> int:
+    """
+    Counts the given (weekday, from_hour, to_hour) schedules, that are in the database.
+    """
+    rows = Schedule.objects.filter(weekday__in={weekday for weekday, from_hour, to_hour in schedule_keys})\
+        .values_list('weekday', 'from_hour', 'to_hour')
+    return sum(row in schedule_keys for row in rows)
+
+
+def get_or_create_schedules(schedule_keys: set) -> tuple:
+    """
+    Resolves (weekday, from_hour, to_hour) tuples to Schedule instances. Existing schedules are
+    taken from the ScheduleIndex and the missing ones are created with one bulk_create().
+    :param schedule_keys: set of (weekday, from_hour, to_hour) tuples
+    :return: (dictionary {(weekday, from_hour, to_hour): Schedule instance}, number of created schedules)
+    """
+    if not schedule_keys:
+        return {}, 0
+
+    created = 0
+    missing = schedule_keys - get_schedule_index().by_key.keys()
+    if missing:
+        # with ignore_conflicts, bulk_create() returns all of the objects, also the ones, that another
+        # request has inserted first, so the created schedules are counted in the database
+        existing = count_schedules(missing)
+        Schedule.objects.bulk_create([Schedule(weekday=weekday, from_hour=from_hour, to_hour=to_hour)
+                                      for weekday, from_hour, to_hour in missing], ignore_conflicts=True)
+        created = count_schedules(missing) - existing
+        # bulk_create() doesn't send post_save signals
+        invalidate_schedule_index()
+
+    schedules = get_schedule_index().by_key
+    return {key: schedules[key] for key in schedule_keys}, created
+
+
+def set_schedules(db_object: Union[Worker, Location], schedule_keys: set) -> None:
+    """
+    Makes the work_schedule of the Worker or the Location equal to the given schedules.
+    Only the difference is written: links, that are already there, are kept, and the added
+    and the removed ones are written with one query each.
+    :param db_object: an instance of Worker or Location class
+    :param schedule_keys: set of (weekday, from_hour, to_hour) tuples
+    :return: None
+    """
+    requested = {schedule.pk for schedule in get_or_create_schedules(schedule_keys)[0].values()}
+    current = {schedule.pk for schedule in db_object.work_schedule.all()}
+
+    if current - requested:
+        db_object.work_schedule.remove(*(current - requested))
+    if requested - current:
+        db_object.work_schedule.add(*(requested - current))
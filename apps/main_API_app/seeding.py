@@ -0,0 +1,182 @@
+# Standard library imports
+import random
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+# Third party imports
+from django.db import transaction
+
+# Local app imports
+from . import caching
+from .availability import get_slot_settings, minutes_mask, to_minutes
+from .models import Location, Worker, Client, Schedule, Appointment
+from .schedules import get_or_create_schedules, get_schedule_index, invalidate_schedule_index
+
+# (value, weight) pairs, the data is drawn from
+SPECIALTIES = (('Therapist', 30), ('Dentist', 20), ('Pediatrician', 15), ('Cardiologist', 10),
+               ('Dermatologist', 10), ('Neurologist', 8), ('Surgeon', 7))
+APPOINTMENT_TYPES = (('Consultation', 50), ('Follow-up', 25), ('Check-up', 15), ('Procedure', 10))
+WORKER_SHIFTS = (((8, 0), (14, 0)), ((14, 0), (20, 0)), ((9, 0), (17, 0)), ((10, 0), (18, 0)), ((8, 0), (12, 0)))
+LOCATION_HOURS = (((8, 0), (20, 0)), ((8, 0), (18, 0)))
+
+
+def weighted_choice(rng: random.Random, choices: tuple):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+class AppointmentGenerator:
+    """
+    Generates random appointments, that pass Appointment.clean(): every appointment fits the schedules
+    of its worker and location, and doesn't overlap other appointments of the worker, the location or
+    the client. Booked minutes are kept in bitsets (see availability.py). Popular workers get more
+    appointments (Zipf-like distribution), dates are uniform.
+    """
+    def __init__(self, workers: list, locations: list, clients: list, date_from: date, days: int,
+                 rng: random.Random):
+        self.workers = workers
+        self.clients = clients
+        self.date_from = date_from
+        self.days = days
+        self.rng = rng
+        self.worker_weights = [1 / (rank + 1) ** 0.5 for rank in range(len(workers))]
+        self.booked = defaultdict(int)
+
+        schedule_index = get_schedule_index()
+        self.worker_schedules = {worker.pk: schedule_index.get_worker_schedules(worker.pk) for worker in workers}
+        self.slot_lengths = {worker.pk: get_slot_settings(worker)[0] for worker in workers}
+        self.location_schedules = defaultdict(list)
+        for location in locations:
+            for schedule in schedule_index.get_location_schedules(location.pk):
+                self.location_schedules[schedule.weekday].append((location, schedule))
+
+    def book(self, appointment: Appointment) -> None:
+        """
+        Marks the time of the appointment as booked.
+        """
+        mask = minutes_mask(to_minutes(appointment.start_time), to_minutes(appointment.end_time, round_up=True))
+        for key in (('worker', appointment.worker_id), ('location', appointment.location_id),
+                    ('client', appointment.client_id)):
+            self.booked[(*key, appointment.date)] |= mask
+
+    def is_free(self, kind: str, pk: int, appointment_date: date, mask: int) -> bool:
+        return not self.booked[(kind, pk, appointment_date)] & mask
+
+    def generate(self, attempts: int = 50):
+        """
+        Returns a new (unsaved) appointment, or None if no free time was found.
+        """
+        for _ in range(attempts):
+            appointment_date = self.date_from + timedelta(days=self.rng.randrange(self.days))
+            weekday = appointment_date.weekday()
+            worker = self.rng.choices(self.workers, self.worker_weights)[0]
+            schedules = [schedule for schedule in self.worker_schedules[worker.pk] if schedule.weekday == weekday]
+            if not schedules:
+                continue
+
+            schedule = self.rng.choice(schedules)
+            slot_length = self.slot_lengths[worker.pk]
+            slots = (to_minutes(schedule.to_hour) - to_minutes(schedule.from_hour)) // slot_length
+            if not slots:
+                continue
+            start = to_minutes(schedule.from_hour) + self.rng.randrange(slots) * slot_length
+            end = start + slot_length
+            mask = minutes_mask(start, end)
+            if not self.is_free('worker', worker.pk, appointment_date, mask):
+                continue
+
+            locations = [location for location, location_schedule in self.location_schedules[weekday]
+                         if to_minutes(location_schedule.from_hour) <= start
+                         and to_minutes(location_schedule.to_hour) >= end
+                         and self.is_free('location', location.pk, appointment_date, mask)]
+            client = self.rng.choice(self.clients)
+            if not locations or not self.is_free('client', client.pk, appointment_date, mask):
+                continue
+
+            appointment = Appointment(type=weighted_choice(self.rng, APPOINTMENT_TYPES), date=appointment_date,
+                                      start_time=time(start // 60, start % 60), end_time=time(end // 60, end % 60),
+                                      worker=worker, location=self.rng.choice(locations), client=client)
+            self.book(appointment)
+            return appointment
+
+        return None
+
+
+def add_schedules(model, instances: list, schedule_keys: dict) -> None:
+    """
+    Links the instances to their schedules with one bulk_create().
+    :param model: Worker or Location
+    :param instances: saved instances
+    :param schedule_keys: dictionary {instance: set of (weekday, from_hour, to_hour)}
+    """
+    schedules = get_or_create_schedules(set().union(*schedule_keys.values()))[0]
+    through = model.work_schedule.through
+    owner_field = f'{model._meta.model_name}_id'
+    through.objects.bulk_create([through(**{owner_field: instance.pk, 'schedule_id': schedules[key].pk})
+                                 for instance in instances for key in schedule_keys[instance]])
+
+
+def seed_scheduling_data(locations: int, workers: int, clients: int, appointments: int, days: int = 30,
+                         seed: int = 0, date_from: date = None) -> dict:
+    """
+    Generates locations, workers with their schedules, clients and appointments for the next days.
+    Everything is written with bulk_create() in one transaction.
+    :param locations: number of locations
+    :param workers: number of workers
+    :param clients: number of clients
+    :param appointments: number of appointments to generate (fewer are created if there is no free time left)
+    :param days: appointments are spread over this number of days, starting from date_from
+    :param seed: random seed, the same seed generates the same data
+    :param date_from: first date of the appointments, tomorrow by default
+    :return: dictionary with the number of created objects of every kind
+    """
+    rng = random.Random(seed)
+    date_from = date_from or date.today() + timedelta(days=1)
+    last_pks = {model: model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+                for model in (Location, Worker, Client)}
+
+    with transaction.atomic():
+        Location.objects.bulk_create([
+            Location(name=f'Room {last_pks[Location] + 1 + index}', address=f'{rng.randint(1, 200)} Seed street')
+            for index in range(locations)])
+        Worker.objects.bulk_create([
+            Worker(first_name=f'Worker {last_pks[Worker] + 1 + index}', last_name=f'Seed {rng.randint(1, 999)}',
+                   phone=f'380{rng.randint(10 ** 8, 10 ** 9 - 1)}', specialty=weighted_choice(rng, SPECIALTIES))
+            for index in range(workers)])
+        Client.objects.bulk_create([
+            Client(first_name=f'Client {last_pks[Client] + 1 + index}', last_name=f'Seed {rng.randint(1, 999)}',
+                   phone=f'380{rng.randint(10 ** 8, 10 ** 9 - 1)}')
+            for index in range(clients)])
+
+        # bulk_create() doesn't return pks on every database
+        new_locations, new_workers, new_clients = (list(model.objects.filter(pk__gt=last_pks[model]).order_by('pk'))
+                                                   for model in (Location, Worker, Client))
+
+        location_schedules = {}
+        for location in new_locations:
+            (from_hour, to_hour) = LOCATION_HOURS[rng.randrange(len(LOCATION_HOURS))]
+            location_schedules[location] = {(weekday, time(*from_hour), time(*to_hour))
+                                             for weekday in range(6 if rng.random() < 0.7 else 5)}
+        worker_schedules = {}
+        for worker in new_workers:
+            weekdays = rng.sample(range(6), rng.randint(3, 5))
+            worker_schedules[worker] = {(weekday, *(time(*hours) for hours in rng.choice(WORKER_SHIFTS)))
+                                        for weekday in weekdays}
+
+        add_schedules(Location, new_locations, location_schedules)
+        add_schedules(Worker, new_workers, worker_schedules)
+        invalidate_schedule_index()
+
+        generator = AppointmentGenerator(new_workers, new_locations, new_clients, date_from, days, rng)
+        for appointment in Appointment.objects.filter(date__gte=date_from).only('date', 'start_time', 'end_time',
+                                                                                'worker', 'location', 'client'):
+            generator.book(appointment)
+        new_appointments = [appointment for appointment in (generator.generate() for _ in range(appointments))
+                            if appointment is not None]
+        Appointment.objects.bulk_create(new_appointments, batch_size=5000)
+
+    # bulk operations don't send model signals
+    caching.bump_versions([caching.SCHEDULES_VERSION, caching.LOCATIONS_VERSION])
+
+    return {'locations': len(new_locations), 'workers': len(new_workers), 'clients': len(new_clients),
+            'schedules': Schedule.objects.count(), 'appointments': len(new_appointments)}
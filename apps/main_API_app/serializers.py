@@ -1,5 +1,4 @@
 # Standard library imports
-import json
 from datetime import datetime
 from typing import Union
 
@@ -12,42 +11,109 @@ from rest_framework.validators import UniqueValidator
 
 # Local app imports
 from .models import Location, Worker, Client, Schedule, Appointment
+from .availability import get_available_slots_map
+from .booking import book_appointment
+from .schedules import WEEKDAYS, parse_schedules, set_schedules
 
-WEEKDAYS = {
-    'monday': 0,
-    'tuesday': 1,
-    'wednesday': 2,
-    'thursday': 3,
-    'friday': 4,
-    'saturday': 5,
-    'sunday': 6
-}
 
-
-def set_or_update_schedule(db_object: Union[Worker, Location], schedules: Union[dict, list]) -> None:
+def set_or_update_schedule(db_object: Union[Worker, Location], schedules: Union[dict, list, None]) -> None:
     """
     A helper function for Worker and Location classes. It's task is to update the work_schedule field.
+    Only the added and the removed schedules are written, and if schedules is None
+    (work_schedule wasn't passed), the work_schedule is left untouched.
     :param db_object: an instance of Worker or Location class
     :param schedules: a list or dictionary containing schedule data
     :return: None
     """
-    if isinstance(schedules, dict):
-        schedule_obj, created_status = Schedule.objects.get_or_create(
-            weekday=WEEKDAYS.get(schedules.get('weekday').lower()),
-            from_hour=schedules.get('from_hour'),
-            to_hour=schedules.get('to_hour'))
+    if schedules is None:
+        return
+
+    try:
+        schedule_keys = parse_schedules(schedules)
+    except (AttributeError, TypeError, ValueError) as error:
+        raise serializers.ValidationError({'work_schedule': str(error)})
+
+    set_schedules(db_object, schedule_keys)
+
+
+def check_required_fields(validated_data: dict, fields: tuple) -> None:
+    """
+    Checks that the fields of a new Worker or Location are passed (to_internal_value() returns only the passed ones).
+    :param validated_data: data returned by to_internal_value()
+    :param fields: required field names
+    :return: None
+    """
+    errors = {field: ['This field is required.'] for field in fields if validated_data.get(field) is None}
+    if errors:
+        raise serializers.ValidationError(errors)
+
+
+def get_selected_fields(request, field_names: tuple) -> tuple:
+    """
+    Returns the fields, that are selected with 'fields' and excluded with 'omit' query parameters
+    (comma-separated field names), e.g. ?fields=pk,first_name or ?omit=available_slots.
+    Only GET requests are affected, all fields are returned for the other requests.
+    :param request: DRF request or None
+    :param field_names: all fields of the serializer
+    :return: selected field names in the serializer's order
+    """
+    selected = tuple(field_names)
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return selected
+
+    for parameter in ('fields', 'omit'):
+        value = request.query_params.get(parameter)
+        if not value:
+            continue
+
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names - set(field_names)
+        if unknown:
+            raise serializers.ValidationError({parameter: f'Unknown fields: {", ".join(sorted(unknown))}'})
+        selected = tuple(name for name in selected if (name in names) == (parameter == 'fields'))
 
-        db_object.work_schedule.clear()
-        db_object.work_schedule.add(schedule_obj)
+    return selected
+
+
+def restrict_queryset(queryset, serializer_class, selected: tuple, ordering: tuple = ('pk',)):
+    """
+    Loads only the model fields, that the selected serializer fields need, with .only(), and prefetches
+    many-to-many fields only if they are selected. The queryset is returned as it is, if all fields are selected.
+    :param queryset: queryset of the serializer's model
+    :param serializer_class: serializer with SparseFieldsSerializerMixin
+    :param selected: selected fields, see get_selected_fields()
+    :param ordering: fields, that are loaded anyway
+    """
+    meta = serializer_class.Meta
+    if selected == tuple(meta.fields):
+        return queryset
 
-    elif isinstance(schedules, list):
-        db_object.work_schedule.clear()
-        for sched in schedules:
-            schedule_obj, created_status = Schedule.objects.get_or_create(
-                weekday=WEEKDAYS.get(sched.get('weekday').lower()),
-                from_hour=sched.get('from_hour'),
-                to_hour=sched.get('to_hour'))
-            db_object.work_schedule.add(schedule_obj)
+    model_meta = queryset.model._meta
+    concrete_fields = {field.name for field in model_meta.concrete_fields}
+    many_to_many = {field.name for field in model_meta.many_to_many}
+
+    loaded = set(ordering)
+    for name in selected:
+        if name in concrete_fields:
+            loaded.add(name)
+        loaded.update(getattr(meta, 'only_fields', {}).get(name, ()))
+
+    prefetched = [lookup for lookup in queryset._prefetch_related_lookups
+                  if lookup.split('__')[0] not in many_to_many or lookup.split('__')[0] in selected]
+    return queryset.only(*loaded).prefetch_related(None).prefetch_related(*prefetched)
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Removes the fields, that aren't selected in the request (see get_selected_fields()), so excluded
+    computed fields (e.g. available_slots) aren't evaluated at all. Meta.only_fields lists the model
+    fields, that computed fields need, see restrict_queryset().
+    """
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsSerializerMixin, self).__init__(*args, **kwargs)
+        selected = get_selected_fields(self.context.get('request'), self.Meta.fields)
+        for name in set(self.Meta.fields) - set(selected):
+            self.fields.pop(name)
 
 
 class ScheduleSerializer(serializers.ModelSerializer):
@@ -85,7 +151,7 @@ class ScheduleSerializer(serializers.ModelSerializer):
         }
 
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Location model.
     """
@@ -104,21 +170,17 @@ class LocationSerializer(serializers.ModelSerializer):
         Receives data from request, and transforms it to a valid data,
         which can be used to create or update the instance.
         """
-        name = data.get('name')
-        address = data.get('address')
-        work_schedule = json.loads(data.get('work_schedule'))
-
-        return {'name': name,
-                'address': address,
-                'work_schedule': work_schedule
-                }
+        # only the passed fields are returned, so that update() changes only them.
+        # work_schedule is a JSON string (form data) or a list, it's parsed in set_or_update_schedule()
+        return {field: data.get(field) for field in ('name', 'address', 'work_schedule') if field in data}
 
     def create(self, validated_data):
         """
         Overwrites the default method to properly process the data when creating a new object.
         """
+        check_required_fields(validated_data, ('name', 'address'))
         try:
-            schedules = validated_data.pop('work_schedule')
+            schedules = validated_data.pop('work_schedule', None)
             location = Location(**validated_data)
             location.save()
             set_or_update_schedule(location, schedules)
@@ -133,8 +195,9 @@ class LocationSerializer(serializers.ModelSerializer):
         Overwrites the default method to properly process the data when updating the object.
         """
         try:
-            instance.name = validated_data.get('name', instance.name)
-            instance.address = validated_data.get('address', instance.address)
+            for field in 'name', 'address':
+                if field in validated_data:
+                    setattr(instance, field, validated_data[field])
             set_or_update_schedule(instance, validated_data.get('work_schedule'))
         except ValidationError:
             raise serializers.ValidationError('Sorry, validation error occurred.')
@@ -144,7 +207,7 @@ class LocationSerializer(serializers.ModelSerializer):
         return instance
 
 
-class WorkerSerializer(serializers.ModelSerializer):
+class WorkerSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Worker model.
     """
@@ -161,22 +224,20 @@ class WorkerSerializer(serializers.ModelSerializer):
                   'available_slots',
                   'work_schedule',
                   )
+        # model fields, that are needed to calculate available_slots, see availability.get_slot_settings()
+        only_fields = {'available_slots': ('specialty', 'slot_length', 'buffer_time')}
 
     def get_available_slots(self, instance) -> list:
         """
         Function that is used to retrieve Worker's available slots for today.
+        If the view has already calculated the slots for the whole list (see FilterWorkersView),
+        they are taken from the serializer context instead of being queried per worker.
         :param instance: Worker class instance
         :return: free slots (list)
         """
-        def __generate_slots_range(start: int, stop: int) -> set:
-            """
-            Small function for time data conversion.
-            :param start: start_time (int)
-            :param stop: end_time (int)
-            :return: list
-            """
-            slots = {f'0{slot}:00' if slot // 10 == 0 else f'{slot}:00' for slot in range(start, stop)}
-            return slots
+        available_slots = self.context.get('available_slots')
+        if available_slots is not None and instance.pk in available_slots:
+            return available_slots[instance.pk]
 
         date = self.context.get('date')
 
@@ -185,54 +246,25 @@ class WorkerSerializer(serializers.ModelSerializer):
         else:
             requested_date = datetime.today().date()
 
-        free_slots = set()
-
-        worker_schedules = Schedule.objects.filter(weekday=requested_date.weekday(),
-                                                   worker=instance.pk)
-
-        for schedule in worker_schedules:
-            slots = __generate_slots_range(schedule.from_hour.hour, schedule.to_hour.hour)
-            free_slots.update(slots)
-
-        worker_appointments = Appointment.objects.filter(worker=instance.pk,
-                                                         date=requested_date)
-        for appointment in worker_appointments:
-            booked_slots = __generate_slots_range(appointment.get_hour('start'), appointment.get_hour('end'))
-            for slot in booked_slots:
-                try:
-                    free_slots.remove(slot)
-                except KeyError:
-                    pass
-
-        return sorted(free_slots)
+        return get_available_slots_map([instance], requested_date)[instance.pk]
 
     def to_internal_value(self, data):
         """
         Receives data from request, and transforms it to a valid data,
         which can be used to create or update the instance.
         """
-        first_name = data.get('first_name')
-        last_name = data.get('last_name')
-        phone = data.get('phone')
-        specialty = data.get('specialty')
-        if data.get('work_schedule'):
-            work_schedule = json.loads(data.get('work_schedule'))
-        else:
-            work_schedule = None
-
-        return {'first_name': first_name,
-                'last_name': last_name,
-                'phone': phone,
-                'specialty': specialty,
-                'work_schedule': work_schedule
-                }
+        # only the passed fields are returned, so that update() changes only them.
+        # work_schedule is a JSON string (form data) or a list, it's parsed in set_or_update_schedule()
+        return {field: data.get(field) for field in ('first_name', 'last_name', 'phone', 'specialty', 'work_schedule')
+                if field in data}
 
     def create(self, validated_data):
         """
         Overwrites the default method to properly process the data when creating a new object.
         """
+        check_required_fields(validated_data, ('first_name', 'last_name', 'phone', 'specialty'))
         try:
-            schedules = validated_data.pop('work_schedule')
+            schedules = validated_data.pop('work_schedule', None)
             worker = Worker(**validated_data)
             worker.save()
             set_or_update_schedule(worker, schedules)
@@ -247,10 +279,9 @@ class WorkerSerializer(serializers.ModelSerializer):
         Overwrites the default method to properly process the data when updating the object.
         """
         try:
-            instance.first_name = validated_data.get('first_name', instance.first_name)
-            instance.last_name = validated_data.get('last_name', instance.last_name)
-            instance.phone = validated_data.get('phone', instance.phone)
-            instance.specialty = validated_data.get('specialty', instance.specialty)
+            for field in 'first_name', 'last_name', 'phone', 'specialty':
+                if field in validated_data:
+                    setattr(instance, field, validated_data[field])
             set_or_update_schedule(instance, validated_data.get('work_schedule'))
         except ValidationError:
             raise serializers.ValidationError('Sorry, validation error occured.')
@@ -272,7 +303,7 @@ class ClientSerializer(serializers.ModelSerializer):
                   )
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Appointment model.
     """
@@ -303,8 +334,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         )
 
         try:
-            appointment.clean()
-            appointment.save()
+            book_appointment(appointment)
         except ValidationError as argument:
             raise serializers.ValidationError(str(argument))
 
@@ -323,14 +353,27 @@ class AppointmentSerializer(serializers.ModelSerializer):
         instance.location = validated_data.get('location', instance.location)
 
         try:
-            instance.clean()
-            instance.save()
+            book_appointment(instance)
         except ValidationError as argument:
             raise serializers.ValidationError(str(argument))
 
         return instance
 
 
+class AppointmentBulkSerializer(serializers.Serializer):
+    """
+    Serializer for a single item of a bulk appointment creation. Related objects are passed as pks
+    and are loaded for the whole batch at once, see booking.book_appointments().
+    """
+    type = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    worker = serializers.IntegerField()
+    client = serializers.IntegerField()
+    location = serializers.IntegerField()
+
+
 # New admin registration serializer
 class UserSerializer(serializers.ModelSerializer):
     """
@@ -0,0 +1,159 @@
+# Third party imports
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+# Local app imports
+from . import caching
+from .authentication import invalidate_user_snapshot
+from .models import Location, Worker, Schedule, Appointment
+from .schedules import invalidate_schedule_index
+
+
+def appointment_versions(worker_pk: int, specialty: str, appointment_date) -> list:
+    """
+    Returns versions, that depend on appointments of the worker at the date.
+    """
+    versions = [caching.day_version(appointment_date), caching.day_version(appointment_date, specialty)]
+    if worker_pk is not None:
+        versions.append(caching.worker_day_version(worker_pk, appointment_date))
+    return versions
+
+
+def get_worker_specialty(appointment: Appointment) -> str:
+    """
+    Returns the specialty of the appointment's worker without loading the whole worker, if it isn't loaded yet.
+    """
+    if appointment.worker_id is None:
+        return None
+    if Appointment.worker.is_cached(appointment):
+        return appointment.worker.specialty
+    return Worker.objects.filter(pk=appointment.worker_id).values_list('specialty', flat=True).first()
+
+
+def worker_versions(worker_pk: int, specialty: str) -> list:
+    """
+    Returns versions, that depend on the worker's data and schedules.
+    """
+    return [caching.worker_version(worker_pk), caching.specialty_version(), caching.specialty_version(specialty)]
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    """
+    Remembers the worker and the date the appointment had before the change,
+    so that the availability at the old date is invalidated as well.
+    """
+    instance._previous_slot = None
+    if instance.pk is not None:
+        instance._previous_slot = Appointment.objects.filter(pk=instance.pk)\
+            .values_list('worker', 'worker__specialty', 'date').first()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_availability(sender, instance, **kwargs):
+    versions = appointment_versions(instance.worker_id, get_worker_specialty(instance), instance.date)
+
+    previous_slot = getattr(instance, '_previous_slot', None)
+    if previous_slot:
+        versions += appointment_versions(*previous_slot)
+
+    caching.bump_versions(versions)
+
+
+@receiver(pre_save, sender=Worker)
+def remember_worker_specialty(sender, instance, **kwargs):
+    """
+    Remembers the specialty the worker had before the change.
+    """
+    instance._previous_specialty = None
+    if instance.pk is not None:
+        instance._previous_specialty = Worker.objects.filter(pk=instance.pk).values_list('specialty', flat=True).first()
+
+
+@receiver(post_save, sender=Worker)
+@receiver(post_delete, sender=Worker)
+def invalidate_worker_availability(sender, instance, **kwargs):
+    versions = worker_versions(instance.pk, instance.specialty)
+
+    previous_specialty = getattr(instance, '_previous_specialty', None)
+    if previous_specialty:
+        versions.append(caching.specialty_version(previous_specialty))
+
+    caching.bump_versions(versions)
+    # deleted workers' links are removed without m2m_changed, and a new worker may reuse the pk
+    if kwargs.get('created', True):
+        invalidate_schedule_index()
+
+
+@receiver(m2m_changed, sender=Worker.work_schedule.through)
+def invalidate_worker_schedule(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    invalidate_schedule_index()
+    if not reverse:
+        caching.bump_versions(worker_versions(instance.pk, instance.specialty))
+    elif pk_set:
+        versions = []
+        for worker_pk, specialty in Worker.objects.filter(pk__in=pk_set).values_list('pk', 'specialty'):
+            versions += worker_versions(worker_pk, specialty)
+        caching.bump_versions(versions)
+    else:
+        # schedule.worker_set.clear() doesn't tell which workers were affected
+        caching.bump_versions([caching.SCHEDULES_VERSION])
+
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def invalidate_schedules(sender, instance, **kwargs):
+    invalidate_schedule_index()
+    caching.bump_versions([caching.SCHEDULES_VERSION])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(m2m_changed, sender=Location.work_schedule.through)
+def invalidate_locations(sender, instance, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        caching.bump_versions([caching.LOCATIONS_VERSION])
+        if kwargs.get('created', True):
+            invalidate_schedule_index()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        user_pks = [instance.pk]
+    elif pk_set:
+        user_pks = pk_set
+    else:
+        # group.user_set.clear() doesn't tell which users were affected
+        user_pks = User.objects.values_list('pk', flat=True)
+    for user_pk in user_pks:
+        invalidate_user_snapshot(user_pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    users = User.objects.all()
+    if not reverse:
+        users = users.filter(groups=instance)
+    elif pk_set:
+        users = users.filter(groups__in=pk_set)
+    for user_pk in users.values_list('pk', flat=True).distinct():
+        invalidate_user_snapshot(user_pk)
@@ -1,3 +1,1242 @@
-from django.test import TestCase
+# Standard library imports
+import gzip
+import json
+import os
+import random
+import tempfile
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from itertools import combinations
+from unittest import mock, skipUnless
 
-# Create your tests here.
+# Third party imports
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import ResolverMatch, URLResolver
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.generics import ListAPIView
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Local app imports
+from . import caching, urls as app_urls
+from .authentication import CachedJWTAuthentication
+from .availability import compute_free_slots
+from .benchmarks import compare_with_baseline
+from .backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from .booking import OVERLAP_MESSAGE, book_appointment, retry_when_locked
+from .exporting import export_appointments
+from .instrumentation import JsonFormatter
+from .mixins import ConditionalGetMixin
+from .models import Location, Worker, Client, Schedule, Appointment
+from .routers import ReplicaRouter, RoutingState, current_state, enable_replica_reads, primary_reads
+from .schedules import ScheduleIndex, get_or_create_schedules, get_schedule_index, has_uncommitted_changes
+from .seeding import seed_scheduling_data
+from .serializers import AppointmentSerializer, ClientSerializer, ScheduleSerializer
+
+# The test cache is a LocMemCache, so versioned entries and ETags have to be enabled explicitly
+shared_cache = override_settings(AVAILABILITY_CACHE={**settings.AVAILABILITY_CACHE, 'SHARED': True})
+process_local_cache = override_settings(AVAILABILITY_CACHE={**settings.AVAILABILITY_CACHE, 'SHARED': None})
+shared_user_cache = override_settings(JWT_USER_CACHE={**settings.JWT_USER_CACHE, 'SHARED': True})
+
+
+class SchedulingDataMixin:
+    """
+    Creates the objects most of the test cases need. Only the values, that matter for a test,
+    are passed, the other fields are the same everywhere.
+    """
+    def create_schedule(self, weekday: int, from_hour: time = time(9), to_hour: time = time(17)) -> Schedule:
+        return Schedule.objects.create(weekday=weekday, from_hour=from_hour, to_hour=to_hour)
+
+    def create_worker(self, first_name: str = 'Worker', specialty: str = 'Therapist', schedules: list = ()) -> Worker:
+        worker = Worker.objects.create(first_name=first_name, last_name='Test', phone='380000000000',
+                                       specialty=specialty)
+        if schedules:
+            worker.work_schedule.add(*schedules)
+        return worker
+
+    def create_location(self, name: str = 'Room 1', schedules: list = ()) -> Location:
+        location = Location.objects.create(name=name, address='Test street')
+        if schedules:
+            location.work_schedule.add(*schedules)
+        return location
+
+    def create_client(self, first_name: str = 'Client') -> Client:
+        return Client.objects.create(first_name=first_name, last_name='Test', phone='380000000000')
+
+    def create_appointment(self, appointment_date: date, start_time: time, end_time: time, worker: Worker,
+                           location: Location = None, client: Client = None) -> Appointment:
+        return Appointment.objects.create(type='Consultation', date=appointment_date, start_time=start_time,
+                                          end_time=end_time, worker=worker, location=location, client=client)
+
+    def create_admin(self) -> User:
+        return User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def create_admin_client(self) -> APIClient:
+        """
+        Returns an API client, that is authenticated as a superuser.
+        """
+        api_client = APIClient()
+        api_client.force_authenticate(self.create_admin())
+        return api_client
+
+
+class ConcurrentBookingTestCase(SchedulingDataMixin, TransactionTestCase):
+    """
+    Fires many bookings in parallel and checks that none of them overlap.
+    """
+    bookings = 300
+    threads = 16
+    # a floor well below what any machine reaches, so only retry storms or lock timeouts fail it
+    min_throughput = 5
+
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        schedule = self.create_schedule(self.date.weekday(), time(8), time(20))
+
+        self.workers = [self.create_worker(f'Worker {i}', schedules=[schedule]) for i in range(5)]
+        self.locations = [self.create_location(f'Room {i}', schedules=[schedule]) for i in range(5)]
+        self.clients = [self.create_client(f'Client {i}') for i in range(20)]
+
+    def book(self, appointment: Appointment) -> bool:
+        try:
+            book_appointment(appointment)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_do_not_overlap(self):
+        randomizer = random.Random(0)
+        appointments = []
+        for _ in range(self.bookings):
+            start = randomizer.randrange(8 * 60, 19 * 60, 15)
+            appointments.append(Appointment(type='Consultation',
+                                            date=self.date,
+                                            start_time=time(*divmod(start, 60)),
+                                            end_time=time(*divmod(start + 45, 60)),
+                                            worker=randomizer.choice(self.workers),
+                                            location=randomizer.choice(self.locations),
+                                            client=randomizer.choice(self.clients)))
+
+        started = timer.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(self.book, appointments))
+        throughput = len(appointments) / (timer.perf_counter() - started)
+
+        # every accepted booking is saved
+        booked = list(Appointment.objects.all())
+        self.assertEqual(len(booked), sum(results))
+        self.assertGreater(len(booked), 0)
+
+        def conflict(first: Appointment, second: Appointment) -> bool:
+            overlaps = first.start_time < second.end_time and second.start_time < first.end_time
+            return overlaps and (first.worker_id == second.worker_id or first.location_id == second.location_id
+                                 or first.client_id == second.client_id)
+
+        for first, second in combinations(booked, 2):
+            self.assertFalse(conflict(first, second))
+
+        # and every rejected one conflicts with a saved booking, so none was lost to a locked database
+        for appointment, result in zip(appointments, results):
+            if not result:
+                self.assertTrue(any(conflict(appointment, other) for other in booked))
+
+        self.assertGreater(throughput, self.min_throughput, f'{throughput:.1f} bookings per second')
+
+
+class FreeSlotsTestCase(SimpleTestCase):
+    """
+    Checks the minute resolution slot calculation.
+    """
+    schedules = [Schedule(from_hour=time(8), to_hour=time(11)),
+                 Schedule(from_hour=time(14), to_hour=time(16))]
+
+    def test_hourly_slots(self):
+        appointments = [Appointment(start_time=time(9, 30), end_time=time(9, 50))]
+
+        self.assertEqual(compute_free_slots(self.schedules, appointments),
+                         ['08:00', '10:00', '14:00', '15:00'])
+
+    def test_short_slots_with_buffer(self):
+        appointments = [Appointment(start_time=time(8, 20), end_time=time(8, 40)),
+                        Appointment(start_time=time(14), end_time=time(14, 5))]
+
+        self.assertEqual(compute_free_slots(self.schedules, appointments, slot_length=20, buffer_time=5),
+                         ['08:50', '09:15', '09:40', '10:05', '10:30', '14:25', '14:50', '15:15', '15:40'])
+
+
+class ListQueryCountTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks that the number of queries of Worker and Location list views doesn't depend on the number of rows.
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        self.schedules = [self.create_schedule(self.date.weekday(), time(8), time(12)),
+                          self.create_schedule(self.date.weekday(), time(13), time(18)),
+                          self.create_schedule((self.date.weekday() + 1) % 7, time(8), time(18))]
+        self.client_instance = self.create_client()
+        self.api_client = self.create_admin_client()
+
+    def create_rows(self, count: int) -> None:
+        for index in range(Worker.objects.count(), Worker.objects.count() + count):
+            worker = self.create_worker(f'Worker {index}', schedules=self.schedules)
+            location = self.create_location(f'Room {index}', schedules=self.schedules)
+            self.create_appointment(self.date, time(9), time(10), worker, location, self.client_instance)
+
+    def count_queries(self, url: str) -> int:
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.api_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow(self):
+        urls = ['/workers/',
+                '/locations/',
+                f'/filter-specialists/?date={self.date}',
+                f'/filter-specialists/?date={self.date}&specialty=Therapist']
+
+        self.create_rows(3)
+        small = [self.count_queries(url) for url in urls]
+        self.create_rows(27)
+        large = [self.count_queries(url) for url in urls]
+
+        self.assertEqual(small, large)
+
+    def test_filtered_workers_are_not_duplicated(self):
+        self.create_rows(5)
+
+        response = self.api_client.get(f'/filter-specialists/?date={self.date}')
+        worker_pks = [worker['pk'] for worker in response.json()]
+
+        self.assertEqual(len(worker_pks), 5)
+        self.assertEqual(len(worker_pks), len(set(worker_pks)))
+
+
+class FilterWorkersRangeTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks available slots of filter-specialists/range/.
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=1)
+        schedules = [self.create_schedule(weekday, time(9), time(13)) for weekday in range(0, 7, 2)]
+        schedules.append(self.create_schedule(1, time(14), time(18)))
+        self.workers = [self.create_worker(f'Worker {index}', schedules=schedules[index:]) for index in range(3)]
+        client = self.create_client()
+        for day in range(0, 14, 3):
+            for index, worker in enumerate(self.workers):
+                self.create_appointment(self.date + timedelta(days=day), time(9 + index), time(10 + index), worker,
+                                        client=client)
+        self.client = APIClient()
+
+    def test_streamed_range_matches_daily_slots(self):
+        response = self.client.get(f'/filter-specialists/range/?from={self.date}&to={self.date + timedelta(days=13)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        workers = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual([worker['pk'] for worker in workers], [worker.pk for worker in self.workers])
+        for day in range(14):
+            requested_date = self.date + timedelta(days=day)
+            response = self.client.get(f'/filter-specialists/?date={requested_date}')
+            # nobody works on some of the weekdays
+            daily_workers = response.json() if response.status_code == 200 else []
+            daily_slots = {worker['pk']: worker['available_slots'] for worker in daily_workers}
+            for worker in workers:
+                self.assertEqual(worker['available_slots'][requested_date.isoformat()],
+                                 daily_slots.get(worker['pk'], []), requested_date)
+
+    def test_invalid_ranges(self):
+        for date_to, error in ((self.date - timedelta(days=1), f'Date can not be before {self.date}'),
+                               (self.date + timedelta(days=62), 'Date range can not be longer than 62 days')):
+            response = self.client.get(f'/filter-specialists/range/?from={self.date}&to={date_to}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'to': error})
+
+        response = self.client.get(f'/filter-specialists/range/?from={self.date}&to={self.date + timedelta(days=61)}')
+        self.assertEqual(response.status_code, 200)
+
+
+class EarliestSlotsTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks filter-specialists/earliest/.
+    """
+    def setUp(self):
+        # a week later, so that it's the same weekday as today
+        self.date = date.today() + timedelta(days=7)
+        weekday = self.date.weekday()
+        morning = self.create_schedule(weekday, time(9), time(12))
+        self.first = self.create_worker('Worker 1', schedules=[self.create_schedule(weekday, time(10), time(13))])
+        self.second = self.create_worker('Worker 2', schedules=[morning])
+        dentist = self.create_worker('Dentist', 'Dentist', [self.create_schedule(weekday, time(8), time(12))])
+        self.busy_location = self.create_location('Room 1', [morning])
+        self.free_location = self.create_location('Room 2', [self.create_schedule(weekday, time(9), time(18))])
+
+        client = self.create_client()
+        self.create_appointment(self.date, time(10), time(11), self.first, client=client)
+        self.create_appointment(self.date, time(9), time(10), self.second, client=client)
+        self.create_appointment(self.date, time(10), time(11), dentist, self.busy_location, client)
+        self.client = APIClient()
+
+    def get_slots(self, query: str) -> list:
+        response = self.client.get(f'/filter-specialists/earliest/?specialty=therapist&{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(slot['date'], slot['start_time'], slot['worker'], slot['location']) for slot in response.json()]
+
+    def test_slots_are_in_time_order(self):
+        day = self.date.isoformat()
+        self.assertEqual(self.get_slots(f'from={self.date}'), [(day, '10:00', self.second.pk, None)])
+        self.assertEqual(self.get_slots(f'from={self.date}&count=4'),
+                         [(day, '10:00', self.second.pk, None), (day, '11:00', self.first.pk, None),
+                          (day, '11:00', self.second.pk, None), (day, '12:00', self.first.pk, None)])
+        # only 4 slots are free at the date
+        self.assertEqual(len(self.get_slots(f'from={self.date}&count=10&days=1')), 4)
+
+    def test_locations(self):
+        day, busy, free = self.date.isoformat(), self.busy_location.pk, self.free_location.pk
+        self.assertEqual(self.get_slots(f'from={self.date}&count=3&location=any'),
+                         [(day, '10:00', self.second.pk, free), (day, '11:00', self.first.pk, busy),
+                          (day, '11:00', self.second.pk, busy)])
+        self.assertEqual(self.get_slots(f'from={self.date}&count=2&location={busy}'),
+                         [(day, '11:00', self.first.pk, busy), (day, '11:00', self.second.pk, busy)])
+        self.assertEqual(self.get_slots(f'from={self.date}&count=2&location={free}'),
+                         [(day, '10:00', self.second.pk, free), (day, '11:00', self.first.pk, free)])
+
+    def test_started_slots_are_skipped(self):
+        today = date.today().isoformat()
+        now = timezone.make_aware(datetime.combine(date.today(), time(10, 30)))
+        with mock.patch('apps.main_API_app.views.timezone.localtime', return_value=now):
+            slots = self.get_slots('count=3')
+
+        self.assertEqual(slots, [(today, '11:00', self.first.pk, None), (today, '11:00', self.second.pk, None),
+                                 (today, '12:00', self.first.pk, None)])
+
+
+class BulkAppointmentTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks bulk appointment creation.
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        schedule = self.create_schedule(self.date.weekday(), time(8), time(18))
+        self.worker = self.create_worker(schedules=[schedule])
+        self.location = self.create_location(schedules=[schedule])
+        self.clients = [self.create_client(f'Client {i}') for i in range(3)]
+        self.api_client = self.create_admin_client()
+
+    def appointment(self, start: str, end: str, client: Client) -> dict:
+        return {'type': 'Consultation', 'date': str(self.date), 'start_time': start, 'end_time': end,
+                'worker': self.worker.pk, 'location': self.location.pk, 'client': client.pk}
+
+    def test_batch_is_validated_in_memory(self):
+        self.create_appointment(self.date, time(8), time(9), self.worker, self.location, self.clients[0])
+        items = [self.appointment('09:00', '10:00', self.clients[1]),
+                 self.appointment('09:30', '10:30', self.clients[2]),
+                 self.appointment('08:30', '09:00', self.clients[2]),
+                 self.appointment('17:30', '18:30', self.clients[2]),
+                 self.appointment('10:00', '11:00', self.clients[2])]
+
+        # schedules are prefetched with the workers and the locations
+        with self.assertNumQueries(9):
+            response = self.api_client.post('/appointments/bulk/', items, format='json')
+        results = response.json()['results']
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([result['start_time'] for result in results if 'errors' not in result],
+                         ['09:00:00', '10:00:00'])
+        self.assertIn('worker', results[1]['errors'])
+        self.assertIn('worker', results[2]['errors'])
+        self.assertIn('date', results[3]['errors'])
+        self.assertEqual(Appointment.objects.count(), 3)
+
+    def test_constraint_rejects_only_overlapping_items(self):
+        items = [self.appointment('09:00', '10:00', self.clients[1]),
+                 self.appointment('10:00', '11:00', self.clients[2])]
+        save = Appointment.save
+
+        def save_or_overlap(appointment, *args, **kwargs):
+            # a concurrent booking, that the constraint catches, is simulated for the second item
+            if appointment.start_time == time(10):
+                raise IntegrityError('appointment_worker_no_overlap')
+            return save(appointment, *args, **kwargs)
+
+        with mock.patch('django.db.models.query.QuerySet.bulk_create', side_effect=IntegrityError), \
+                mock.patch.object(Appointment, 'save', save_or_overlap):
+            response = self.api_client.post('/appointments/bulk/', items, format='json')
+        results = response.json()['results']
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(results[0]['start_time'], '09:00:00')
+        self.assertEqual(results[1]['errors'], {'non_field_errors': [OVERLAP_MESSAGE]})
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class ResourceImportTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks bulk import of workers and locations.
+    """
+    def setUp(self):
+        self.api_client = self.create_admin_client()
+        self.existing = self.create_worker('Worker 0', schedules=[self.create_schedule(0)])
+
+    def test_schedules_are_deduplicated(self):
+        schedule = '[{"weekday": "Monday", "from_hour": "09:00", "to_hour": "17:00"}, ' \
+                   '{"weekday": "Tuesday", "from_hour": "10:00", "to_hour": "14:00"}]'
+        rows = ['first_name,last_name,phone,specialty,work_schedule']
+        rows += [f'Worker {i},Test,380000000001,Therapist,"{schedule.replace(chr(34), chr(34) * 2)}"'
+                 for i in range(50)]
+        upload = SimpleUploadedFile('workers.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_client.post('/workers/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 49, 'updated': 1, 'schedules_created': 1})
+        self.assertLess(len(queries), 20)
+        self.assertEqual(Schedule.objects.count(), 2)
+        self.assertEqual(Worker.work_schedule.through.objects.count(), 100)
+        self.assertEqual(Worker.objects.get(pk=self.existing.pk).phone, '380000000001')
+
+    def test_invalid_rows_are_not_imported(self):
+        rows = [{'name': 'Room 1', 'address': 'Test street'},
+                {'name': 'Room 2', 'address': 'Test street',
+                 'work_schedule': [{'weekday': 'Someday', 'from_hour': '09:00', 'to_hour': '17:00'}]},
+                {'name': 'Room 3'}]
+
+        response = self.api_client.post('/locations/import/', rows, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['rows']), {'1', '2'})
+        self.assertFalse(Location.objects.exists())
+
+    def test_concurrently_created_schedules_are_not_counted(self):
+        # another request has inserted the schedule after the index was loaded
+        key = (0, time(9), time(17))
+        outdated_index = ScheduleIndex(None, [], [], [])
+        with mock.patch('apps.main_API_app.schedules.get_schedule_index',
+                        side_effect=[outdated_index, get_schedule_index()]):
+            schedules, created = get_or_create_schedules({key})
+
+        self.assertEqual(created, 0)
+        self.assertEqual(schedules, {key: Schedule.objects.get()})
+
+    def test_omitted_schedules_are_kept(self):
+        rows = [{'first_name': 'Worker 0', 'last_name': 'Test', 'phone': '380000000001', 'specialty': 'Therapist'},
+                {'first_name': 'Worker 1', 'last_name': 'Test', 'phone': '380000000001', 'specialty': 'Therapist',
+                 'work_schedule': []}]
+        other = self.create_worker('Worker 1', schedules=[Schedule.objects.get()])
+
+        response = self.api_client.post('/workers/import/', rows, format='json')
+
+        self.assertEqual(response.json(), {'created': 0, 'updated': 2, 'schedules_created': 0})
+        self.assertEqual(self.existing.work_schedule.count(), 1)
+        self.assertEqual(other.work_schedule.count(), 0)
+
+
+class ScheduleUpdateTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks that worker updates write only the changed schedule links.
+    """
+    def setUp(self):
+        self.api_client = self.create_admin_client()
+        self.schedules = [self.create_schedule(weekday) for weekday in range(3)]
+        self.worker = self.create_worker(schedules=self.schedules)
+
+    def get_through_queries(self, data: dict) -> list:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api_client.patch(f'/workers/{self.worker.pk}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if 'main_api_app_worker_work_schedule' in query['sql'].lower()
+                and not query['sql'].startswith('SELECT')]
+
+    def test_omitted_schedule_is_untouched(self):
+        self.assertEqual(self.get_through_queries({'phone': '380000000001'}), [])
+        self.assertEqual(Worker.objects.get(pk=self.worker.pk).phone, '380000000001')
+        self.assertEqual(self.worker.work_schedule.count(), 3)
+
+    def test_empty_values_are_set(self):
+        self.get_through_queries({'work_schedule': [], 'phone': ''})
+        self.assertEqual(Worker.objects.get(pk=self.worker.pk).phone, '')
+        self.assertEqual(self.worker.work_schedule.count(), 0)
+
+    def test_required_fields_on_create(self):
+        response = self.api_client.post('/workers/', {'first_name': 'Worker 1', 'last_name': 'Test',
+                                                      'specialty': 'Therapist'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'phone': ['This field is required.']})
+
+    def test_only_difference_is_written(self):
+        work_schedule = [{'weekday': 'Monday', 'from_hour': '09:00', 'to_hour': '17:00'},
+                         {'weekday': 'Tuesday', 'from_hour': '09:00', 'to_hour': '17:00'},
+                         {'weekday': 'Friday', 'from_hour': '10:00', 'to_hour': '12:00'}]
+
+        queries = self.get_through_queries({'work_schedule': work_schedule})
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(sorted((schedule.weekday, schedule.from_hour) for schedule in self.worker.work_schedule.all()),
+                         [(0, time(9)), (1, time(9)), (4, time(10))])
+
+
+@shared_cache
+class ScheduleIndexTestCase(SchedulingDataMixin, TransactionTestCase):
+    """
+    Checks the in-memory schedule index. Changes are committed, so the index can be kept between calls.
+    """
+    def setUp(self):
+        self.schedules = [self.create_schedule(weekday) for weekday in range(2)]
+        self.worker = self.create_worker(schedules=self.schedules[:1])
+
+    def test_index_is_reused_until_changed(self):
+        get_schedule_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_schedule_index().get_worker_schedules(self.worker.pk), [self.schedules[0]])
+            self.assertEqual(get_schedule_index().get_weekday_worker_pks(0), {self.worker.pk})
+
+        self.worker.work_schedule.add(self.schedules[1])
+        self.assertEqual(get_schedule_index().get_worker_schedules(self.worker.pk, 1), [self.schedules[1]])
+
+    def test_uncommitted_changes_are_private(self):
+        index = get_schedule_index()
+        with transaction.atomic():
+            self.worker.work_schedule.add(self.schedules[1])
+            self.assertTrue(has_uncommitted_changes())
+            self.assertEqual(len(get_schedule_index().get_worker_schedules(self.worker.pk)), 2)
+            self.assertEqual(len(index.get_worker_schedules(self.worker.pk)), 1)
+
+        self.assertFalse(has_uncommitted_changes())
+        self.assertEqual(len(get_schedule_index().get_worker_schedules(self.worker.pk)), 2)
+
+    @process_local_cache
+    def test_index_expires_without_shared_cache(self):
+        get_schedule_index()
+        with self.assertNumQueries(0):
+            get_schedule_index()
+
+        # other processes can't bump the version in this process' memory cache
+        with override_settings(AVAILABILITY_CACHE={**settings.AVAILABILITY_CACHE, 'SHARED': None, 'LOCAL_TIMEOUT': 0}):
+            with self.assertNumQueries(3):
+                get_schedule_index()
+
+    def test_rolled_back_changes_are_dropped(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.worker.work_schedule.add(self.schedules[1])
+                self.assertEqual(len(get_schedule_index().get_worker_schedules(self.worker.pk)), 2)
+                raise RuntimeError
+
+        self.assertFalse(has_uncommitted_changes())
+        self.assertEqual(get_schedule_index().get_worker_schedules(self.worker.pk), [self.schedules[0]])
+
+
+class AppointmentExportTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks streaming appointment export.
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        self.worker = self.create_worker()
+        self.client_object = self.create_client()
+        Appointment.objects.bulk_create([Appointment(type='Consultation', date=self.date + timedelta(days=day),
+                                                     start_time=time(hour), end_time=time(hour + 1),
+                                                     worker=self.worker, client=self.client_object)
+                                         for day in range(3) for hour in range(8, 18)])
+        self.api_client = self.create_admin_client()
+
+    def test_csv_export(self):
+        response = self.api_client.get(f'/appointments/export/csv/?from={self.date}&to={self.date}')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(lines[0], 'pk,type,date,start_time,end_time,worker,client,location')
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(lines[1].endswith(f',Consultation,{self.date},08:00:00,09:00:00,{self.worker.pk},'
+                                          f'{self.client_object.pk},'))
+
+    def test_ndjson_export_is_chunked(self):
+        appointments = Appointment.objects.all()
+        chunks = list(export_appointments(appointments, 'ndjson', chunk_size=7))
+        rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(rows, AppointmentSerializer(appointments.order_by('date', 'start_time', 'pk'), many=True).data)
+
+
+class RequestInstrumentationTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks per-request SQL and latency instrumentation.
+    """
+    def setUp(self):
+        self.worker = self.create_worker()
+
+    def test_server_timing_header(self):
+        response = APIClient().get('/filter-specialists/')
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=[\d.]+$')
+
+    @override_settings(REQUEST_INSTRUMENTATION={'SLOW_REQUEST_QUERIES': 0})
+    def test_slow_request_is_logged(self):
+        with self.assertLogs('apps.main_API_app.instrumentation', 'WARNING') as logs:
+            APIClient().get('/filter-specialists/?specialty=nobody')
+
+        record = logs.records[0]
+        self.assertEqual(record.path, '/filter-specialists/')
+        self.assertEqual(record.status, 400)
+        self.assertGreater(record.queries, 0)
+        self.assertEqual(json.loads(JsonFormatter().format(record))['message'], 'Slow request')
+
+
+class MetricsTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks booking and view metrics.
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        schedule = self.create_schedule(self.date.weekday(), time(8), time(18))
+        self.worker = self.create_worker(schedules=[schedule])
+        self.location = self.create_location(schedules=[schedule])
+        self.clients = [self.create_client(f'Client {i}') for i in range(2)]
+        self.api_client = self.create_admin_client()
+
+    def get_sample(self, name: str, labels: dict) -> float:
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_booking_rejections_by_reason(self):
+        attempts = self.get_sample('scheduling_booking_attempts_total', {'mode': 'single'})
+        conflicts = self.get_sample('scheduling_booking_rejections_total', {'reason': 'worker_conflict'})
+        mismatches = self.get_sample('scheduling_booking_rejections_total', {'reason': 'schedule_mismatch'})
+
+        for client, start, end in ((self.clients[0], '09:00', '10:00'), (self.clients[1], '09:30', '10:30'),
+                                   (self.clients[1], '17:30', '18:30')):
+            self.api_client.post('/appointments/', {'type': 'Consultation', 'date': str(self.date),
+                                                    'start_time': start, 'end_time': end, 'worker': self.worker.pk,
+                                                    'location': self.location.pk, 'client': client.pk})
+
+        self.assertEqual(self.get_sample('scheduling_booking_attempts_total', {'mode': 'single'}), attempts + 3)
+        self.assertEqual(self.get_sample('scheduling_booking_rejections_total', {'reason': 'worker_conflict'}),
+                         conflicts + 1)
+        self.assertEqual(self.get_sample('scheduling_booking_rejections_total', {'reason': 'schedule_mismatch'}),
+                         mismatches + 1)
+
+    def test_missing_resources_are_rejected(self):
+        missing = self.get_sample('scheduling_booking_rejections_total', {'reason': 'missing_fields'})
+
+        for field in 'location', 'worker':
+            data = {'type': 'Consultation', 'date': str(self.date), 'start_time': '09:00', 'end_time': '10:00',
+                    'worker': self.worker.pk, 'location': self.location.pk, 'client': self.clients[0].pk, field: None}
+            response = self.api_client.post('/appointments/', data, format='json')
+            self.assertEqual(response.status_code, 400, field)
+            self.assertIn('Please, fill all of the fields.', response.json()[0], field)
+
+        self.assertEqual(self.get_sample('scheduling_booking_rejections_total', {'reason': 'missing_fields'}),
+                         missing + 2)
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_metrics_endpoint(self):
+        self.api_client.get('/filter-specialists/')
+        response = self.api_client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('scheduling_view_duration_seconds_count{method="GET",status="200",view="Worker-list"}',
+                      response.content.decode())
+        self.assertIn('scheduling_availability_computation_seconds{operation="slots"}', response.content.decode())
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+        with override_settings(METRICS={'ENABLED': True, 'ALLOWED_IPS': (), 'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+        with override_settings(METRICS={'ENABLED': False}):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class AppointmentCleanTestCase(SchedulingDataMixin, TestCase):
+    """
+    Checks the schedule and conflict checks of Appointment.clean().
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        schedule = self.create_schedule(self.date.weekday(), time(8), time(18))
+        self.worker = self.create_worker(schedules=[schedule])
+        self.location = self.create_location(schedules=[schedule])
+        self.clients = [self.create_client(f'Client {i}') for i in range(2)]
+        self.booked = self.create_appointment(self.date, time(9), time(10), self.worker, self.location, self.clients[0])
+
+    def appointment(self, start: time, end: time, client: Client) -> Appointment:
+        return Appointment(type='Consultation', date=self.date, start_time=start, end_time=end,
+                           worker=self.worker, location=self.location, client=client)
+
+    def test_checks_run_as_one_query(self):
+        with self.assertNumQueries(1):
+            self.appointment(time(10), time(11), self.clients[1]).clean()
+
+        for start, end, client, message in ((time(9, 30), time(10, 30), self.clients[1], 'specialist is already'),
+                                            (time(17), time(19), self.clients[1], "can't be assigned"),
+                                            (time(7), time(8), self.clients[0], "can't be assigned")):
+            with self.assertRaisesMessage(ValidationError, message):
+                self.appointment(start, end, client).clean()
+
+    def test_appointment_does_not_conflict_with_itself(self):
+        self.booked.start_time, self.booked.end_time = time(9, 30), time(10, 30)
+        self.booked.clean()
+
+        self.worker.work_schedule.clear()
+        with self.assertRaisesMessage(ValidationError, "can't be assigned"):
+            self.booked.clean()
+
+
+class SeedingTestCase(TestCase):
+    """
+    Checks synthetic data generation and benchmark comparison.
+    """
+    def test_seeded_appointments_are_valid(self):
+        created = seed_scheduling_data(locations=5, workers=10, clients=50, appointments=300, days=14, seed=1)
+
+        self.assertEqual(created['workers'], 10)
+        self.assertGreater(created['appointments'], 250)
+        for appointment in Appointment.objects.all():
+            appointment.clean()
+
+    def test_regressions_are_detected(self):
+        results = {'appointment_clean': 1.5, 'available_slots': 1.0, 'filter_workers_list': 10.0,
+                   'appointment_list': 5.0, 'client_list': 4.0, 'appointment_page_serializer': 30.0,
+                   'appointment_page_values': 10.0, 'booking_throughput': 300.0}
+        baseline = {'appointment_clean': 1.0, 'available_slots': 1.0, 'filter_workers_list': 10.0,
+                    'booking_throughput': 500.0}
+
+        rows, regressions = compare_with_baseline(results, baseline, tolerance=0.3)
+
+        self.assertEqual(regressions, ['appointment_clean', 'booking_throughput'])
+        self.assertEqual(rows[3][-1], 'new')
+
+    def test_results_are_scaled_by_calibration(self):
+        baseline = {'calibration': 1.0, 'appointment_clean': 1.0, 'booking_throughput': 500.0}
+        # the machine is twice as slow as the baseline's, so is everything else
+        results = {'calibration': 2.0, 'appointment_clean': 2.0, 'available_slots': 1.0, 'filter_workers_list': 10.0,
+                   'appointment_list': 5.0, 'client_list': 4.0, 'appointment_page_serializer': 30.0,
+                   'appointment_page_values': 10.0, 'booking_throughput': 250.0}
+
+        rows, regressions = compare_with_baseline(results, baseline, tolerance=0.3)
+
+        self.assertEqual(regressions, [])
+        self.assertEqual(rows[0][3:], ('1.00', '+0.0%', 'ok'))
+        self.assertEqual(rows[-1][3:], ('500.00', '+0.0%', 'ok'))
+
+
+class EndpointQueryCountTestCase(SchedulingDataMixin, TestCase):
+    """
+    Requests every route of the app with small data and with 10 times more data, and checks that
+    the number of SQL queries is the same. Views are called directly, so routes, that are shadowed
+    by the router, are checked as well. A new route has to be added to get_requests().
+    """
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        self.schedules = [self.create_schedule((self.date.weekday() + day) % 7, time(8), time(18)) for day in range(2)]
+        self.user = self.create_admin()
+        self.count = 0
+
+    def create_rows(self, count: int) -> None:
+        for _ in range(count):
+            self.count += 1
+            location = self.create_location(f'Room {self.count}', schedules=self.schedules)
+            worker = self.create_worker(f'Worker {self.count}', schedules=self.schedules)
+            client = self.create_client(f'Client {self.count}')
+            for hour in (9, 11):
+                self.create_appointment(self.date, time(hour), time(hour + 1), worker, location, client)
+
+    def get_requests(self) -> dict:
+        """
+        Returns {route name: [(method, url kwargs, query string, data), ...]}.
+        """
+        worker, location = Worker.objects.order_by('pk').first(), Location.objects.order_by('pk').first()
+        client, appointment = Client.objects.order_by('pk').first(), Appointment.objects.order_by('pk').first()
+        schedule = [{'weekday': 'Monday', 'from_hour': '09:00', 'to_hour': '17:00'}]
+        new_appointment = {'type': 'Consultation', 'date': str(self.date), 'start_time': '15:00',
+                           'end_time': '16:00', 'worker': worker.pk, 'location': location.pk, 'client': client.pk}
+        date_query = f'date={self.date}&specialty=Therapist'
+        refresh = str(RefreshToken.for_user(self.user))
+
+        return {
+            'api-root': [('get', {}, '', None)],
+            'worker-list': [('get', {}, '', None)],
+            'worker-detail': [('get', {'pk': worker.pk}, '', None),
+                              ('patch', {'pk': worker.pk}, '', {'phone': '380000000001', 'work_schedule': schedule})],
+            'worker-bulk-import': [('post', {}, '', [{'first_name': 'New', 'last_name': 'Worker', 'phone': '380',
+                                                      'specialty': 'Therapist', 'work_schedule': schedule}])],
+            'worker_get_delete_update': [('get', {'pk': worker.pk}, '', None)],
+            'user-list': [('get', {}, '', None)],
+            'user-detail': [('get', {'pk': self.user.pk}, '', None)],
+            'manager_get_delete_update': [('get', {'id': self.user.pk}, '', None)],
+            'client-list': [('get', {}, '', None)],
+            'client-detail': [('get', {'pk': client.pk}, '', None)],
+            'location-list': [('get', {}, '', None)],
+            'location-detail': [('get', {'pk': location.pk}, '', None)],
+            'location-bulk-import': [('post', {}, '', [{'name': 'New', 'address': 'Street',
+                                                        'work_schedule': schedule}])],
+            'location_get_delete_update': [('get', {'pk': location.pk}, '', None)],
+            'appointment-list': [('get', {}, f'from={self.date}', None), ('post', {}, '', new_appointment)],
+            'appointment-detail': [('get', {'pk': appointment.pk}, '', None)],
+            'appointment-bulk': [('post', {}, '', [new_appointment])],
+            'appointment-export': [('get', {'file_format': 'csv'}, '', None)],
+            'appointment_get_delete_update': [('get', {'pk': appointment.pk}, '', None)],
+            'schedule-list': [('get', {}, '', None)],
+            'schedule-detail': [('get', {'pk': self.schedules[0].pk}, '', None)],
+            'Worker-list': [('get', {}, date_query, None)],
+            'Worker-detail': [('get', {'pk': worker.pk}, '', None)],
+            'Worker-date-range': [('get', {}, f'from={self.date}&to={self.date + timedelta(days=2)}', None)],
+            'Worker-earliest': [('get', {}, f'specialty=Therapist&count=5&from={self.date}&location=any', None)],
+            'filter_workers': [('get', {'date': '', 'specialty': 'Therapist'}, date_query, None)],
+            'availability_cache_stats': [('get', {}, '', None)],
+            'token_obtain_pair': [('post', {}, '', {'username': 'admin', 'password': 'password'})],
+            'token_refresh': [('post', {}, '', {'refresh': refresh})],
+        }
+
+    def get_routes(self, patterns=None) -> dict:
+        """
+        Returns {route name: view} for all of the app's URL patterns, except the format suffix ones.
+        """
+        routes = {}
+        for pattern in app_urls.urlpatterns if patterns is None else patterns:
+            if isinstance(pattern, URLResolver):
+                routes.update(self.get_routes(pattern.url_patterns))
+            elif '(?P<format>' not in str(pattern.pattern):
+                routes[pattern.name] = pattern.callback
+        return routes
+
+    def count_queries(self) -> dict:
+        """
+        Makes all requests, each in a rolled back transaction, and counts their queries.
+        :return: {(route name, method): (status code, number of queries)}
+        """
+        factory = APIRequestFactory()
+        routes = self.get_routes()
+        counts = {}
+        for name, requests in self.get_requests().items():
+            for method, kwargs, query, data in requests:
+                request = getattr(factory, method)(f'/?{query}', data, format='json')
+                request.resolver_match = ResolverMatch(routes[name], (), kwargs, url_name=name)
+                # plain Django views read the user set by the authentication middleware
+                request.user = self.user
+                force_authenticate(request, user=self.user)
+                cache.clear()
+
+                with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    response = routes[name](request, **kwargs)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    else:
+                        response.render()
+                    transaction.set_rollback(True)
+
+                counts[(name, method)] = (response.status_code, len(queries))
+        return counts
+
+    def test_every_route_is_checked(self):
+        self.create_rows(1)
+        self.assertEqual(set(self.get_routes()) - set(self.get_requests()), set())
+
+    def test_query_count_does_not_grow(self):
+        self.create_rows(3)
+        small = self.count_queries()
+        self.create_rows(27)
+        large = self.count_queries()
+
+        self.assertEqual([route for route, (status_code, count) in small.items() if status_code >= 400], [])
+        self.assertEqual(small, large)
+
+
+@shared_user_cache
+class CachedAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('manager', 'manager@example.com', 'password', is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/availability-cache/stats/')
+        return response.status_code, len(queries)
+
+    def test_user_is_cached(self):
+        self.assertEqual(self.get_stats()[0], 200)
+        self.assertEqual(self.get_stats(), (200, 0))
+
+    def test_snapshot_is_invalidated(self):
+        self.get_stats()
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.get_stats()[0], 403)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_stats()[0], 401)
+
+    def test_snapshot_user(self):
+        self.get_stats()
+        token = RefreshToken.for_user(self.user).access_token
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, token = CachedJWTAuthentication().authenticate(request)
+
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'manager', True))
+            self.assertFalse(user.has_perm('main_API_app.add_worker'))
+        self.assertEqual(user.email, 'manager@example.com')
+
+    @override_settings(JWT_USER_CACHE={**settings.JWT_USER_CACHE, 'SHARED': None})
+    def test_process_local_cache_is_not_used(self):
+        # another worker couldn't delete the snapshot from this process' memory cache
+        self.get_stats()
+        self.assertFalse(cache.has_key(f'auth:user:{self.user.pk}'))
+        self.assertEqual(self.get_stats(), (200, 1))
+
+
+class SparseFieldsTestCase(SchedulingDataMixin, TestCase):
+    def setUp(self):
+        self.date = date.today() + timedelta(days=7)
+        schedule = self.create_schedule(self.date.weekday())
+        self.location = self.create_location(schedules=[schedule])
+        client = self.create_client()
+        for index in range(3):
+            worker = self.create_worker(f'Worker {index}', schedules=[schedule])
+            self.create_appointment(self.date, time(9 + index), time(10 + index), worker, self.location, client)
+
+        self.client = self.create_admin_client()
+        cache.clear()
+
+    def get(self, url: str):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_slots_are_not_calculated(self):
+        data, all_queries = self.get('/workers/')
+        data, queries = self.get('/workers/?fields=pk,first_name')
+
+        self.assertEqual([set(worker) for worker in data['results']], [{'pk', 'first_name'}] * 3)
+        self.assertEqual(len(queries), 1)
+        self.assertLess(len(queries), len(all_queries))
+        self.assertNotIn('phone', queries[0])
+
+        data, queries = self.get(f'/filter-specialists/?date={self.date}&omit=available_slots,work_schedule')
+        self.assertEqual(set(data[0]), {'pk', 'first_name', 'last_name', 'phone', 'specialty'})
+        self.assertNotIn('appointment', ' '.join(queries))
+
+        # the filter only checks that there are workers, they are loaded once, with the selected fields
+        data, queries = self.get(f'/filter-specialists/?date={self.date}&fields=pk')
+        worker_queries = [query for query in queries if 'FROM "main_API_app_worker"' in query]
+        self.assertEqual(len(data), 3)
+        self.assertEqual(len(worker_queries), 2)
+        self.assertIn('LIMIT 1', worker_queries[0])
+
+    def test_selected_fields(self):
+        data, queries = self.get('/appointments/?fields=pk,date&page_size=2')
+        self.assertEqual([set(appointment) for appointment in data['results']], [{'pk', 'date'}] * 2)
+        self.assertEqual(len(self.get(data['next'])[0]['results']), 1)
+
+        data, queries = self.get(f'/locations/{self.location.pk}/?omit=work_schedule')
+        self.assertEqual(data, {'pk': self.location.pk, 'name': 'Room 1', 'address': 'Test street'})
+        self.assertEqual(len(self.get(f'/locations/{self.location.pk}/')[0]['work_schedule']), 1)
+
+    def test_unknown_field(self):
+        response = self.client.get('/workers/?fields=pk,salary')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': 'Unknown fields: salary'})
+
+
+class ValuesListTestCase(SchedulingDataMixin, TestCase):
+    def setUp(self):
+        tomorrow = date.today() + timedelta(days=1)
+        self.schedule = self.create_schedule(tomorrow.weekday(), time(9), time(17, 30))
+        location = self.create_location()
+        worker = self.create_worker()
+        for index in range(5):
+            client = self.create_client(f'Client {index}')
+            Appointment.objects.create(type='Consultation' if index else None, date=tomorrow,
+                                       start_time=time(9 + index, 15), end_time=time(10 + index),
+                                       worker=worker, location=location, client=client)
+
+        self.client = self.create_admin_client()
+
+    def assertSameContent(self, url: str, serializer_class, queryset):
+        expected = JSONRenderer().render({'next': None, 'results': serializer_class(queryset, many=True).data})
+        self.assertEqual(self.client.get(url).content, expected)
+
+    def test_same_content_as_serializer(self):
+        self.assertSameContent('/appointments/', AppointmentSerializer,
+                               Appointment.objects.order_by('date', 'start_time', 'pk'))
+        self.assertSameContent('/clients/', ClientSerializer, Client.objects.order_by('pk'))
+        self.assertSameContent('/work_schedules/', ScheduleSerializer,
+                               Schedule.objects.order_by('weekday', 'from_hour', 'pk'))
+
+    def test_pages_and_fields(self):
+        response = self.client.get('/clients/?page_size=3').json()
+        self.assertEqual([client['first_name'] for client in response['results']],
+                         ['Client 0', 'Client 1', 'Client 2'])
+        self.assertEqual(len(self.client.get(response['next']).json()['results']), 2)
+
+        response = self.client.get('/appointments/?fields=type,start_time&page_size=1').json()
+        self.assertEqual(response['results'], [{'type': None, 'start_time': '09:15:00'}])
+        self.assertEqual(self.client.get(response['next']).json()['results'][0]['start_time'], '10:15:00')
+
+
+class ReplicaRoutingTestCase(SchedulingDataMixin, TestCase):
+    def setUp(self):
+        self.client = self.create_admin_client()
+        self.replica_reads = 0
+        # the test database has no replica, so replica reads are counted and sent to 'default'
+        patcher = mock.patch('apps.main_API_app.routers.get_replica_alias', side_effect=self.get_replica_alias)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_replica_alias(self):
+        self.replica_reads += 1
+        return DEFAULT_DB_ALIAS
+
+    def get_clients(self) -> int:
+        self.replica_reads = 0
+        self.assertEqual(self.client.get('/clients/').status_code, 200)
+        return self.replica_reads
+
+    def test_reads_go_to_replica(self):
+        self.assertTrue(self.get_clients())
+        self.assertEqual(self.client.get('/workers/').status_code, 200)
+        self.assertNotIn('read_primary', self.client.cookies)
+
+    def test_read_your_writes(self):
+        self.replica_reads = 0
+        response = self.client.post('/work_schedules/', {'weekday': 'Monday', 'from_hour': '09:00', 'to_hour': '17:00'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.replica_reads, 0)
+        self.assertEqual(response.cookies['read_primary']['max-age'], 10)
+
+        # the client keeps the cookie, and reads from the primary, until it expires
+        self.assertEqual(self.get_clients(), 0)
+        del self.client.cookies['read_primary']
+        self.assertTrue(self.get_clients())
+
+    def test_router(self):
+        replica_router = ReplicaRouter()
+        self.assertIsNone(replica_router.db_for_read(Schedule))
+
+        state = RoutingState()
+        token = current_state.set(state)
+        try:
+            self.assertIsNone(replica_router.db_for_read(Schedule))
+            enable_replica_reads()
+            with mock.patch('apps.main_API_app.routers.get_replica_alias', return_value='replica'):
+                self.assertEqual(replica_router.db_for_read(Schedule), 'replica')
+                with primary_reads():
+                    self.assertEqual(replica_router.db_for_read(Schedule), DEFAULT_DB_ALIAS)
+
+                self.assertEqual(replica_router.db_for_write(Schedule), DEFAULT_DB_ALIAS)
+                self.assertEqual(replica_router.db_for_read(Schedule), DEFAULT_DB_ALIAS)
+        finally:
+            current_state.reset(token)
+
+    def test_conflict_checks_read_primary(self):
+        tomorrow = date.today() + timedelta(days=1)
+        schedule = self.create_schedule(tomorrow.weekday())
+        location = self.create_location(schedules=[schedule])
+        worker = self.create_worker(schedules=[schedule])
+        client = self.create_client()
+        self.create_appointment(tomorrow, time(9), time(10), worker, location, client)
+
+        state = RoutingState()
+        state.replica_reads = True
+        token = current_state.set(state)
+        # queries to the (not configured) 'replica' database would fail
+        try:
+            with mock.patch('apps.main_API_app.routers.get_replica_alias', return_value='replica'):
+                with self.assertRaisesMessage(ValidationError, 'already booked'):
+                    Appointment(type='Consultation', date=tomorrow, start_time=time(9, 30), end_time=time(10, 30),
+                                worker=worker, location=location, client=client).clean()
+        finally:
+            current_state.reset(token)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLiteConcurrencyTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3'),
+                              'OPTIONS': {'timeout': 0.05,
+                                          'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+                                          'transaction_mode': 'IMMEDIATE'}}
+
+    def connect(self):
+        wrapper = SQLiteDatabaseWrapper(self.settings_dict, alias='sqlite_concurrency')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_init_command(self):
+        with self.connect().cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone(), (1,))
+
+    def test_transactions_take_write_lock(self):
+        first, second = self.connect(), self.connect()
+        with first.cursor() as cursor:
+            cursor.execute('CREATE TABLE booking (id integer)')
+
+        # what transaction.atomic() does, when it begins
+        first._start_transaction_under_autocommit()
+        # the lock is taken by BEGIN, not by the first write, so the second writer waits from the start
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            second._start_transaction_under_autocommit()
+        # WAL readers aren't blocked by the writer
+        with second.cursor() as cursor:
+            self.assertEqual(cursor.execute('SELECT COUNT(*) FROM booking').fetchone(), (0,))
+
+
+class BookingRetriesTestCase(SimpleTestCase):
+    def test_retried_when_locked(self):
+        attempts, resets = [], []
+
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'booked'
+
+        with override_settings(BOOKING={'LOCKED_RETRY_DELAY': 0}):
+            self.assertEqual(retry_when_locked(write, lambda: resets.append(1)), 'booked')
+        self.assertEqual((len(attempts), len(resets)), (3, 2))
+
+        attempts.clear()
+        with override_settings(BOOKING={'LOCKED_RETRIES': 1, 'LOCKED_RETRY_DELAY': 0}):
+            with self.assertRaisesMessage(OperationalError, 'locked'):
+                retry_when_locked(write)
+        self.assertEqual(len(attempts), 2)
+
+        def fail():
+            attempts.append(1)
+            raise OperationalError('no such table: booking')
+
+        attempts.clear()
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            retry_when_locked(fail)
+        self.assertEqual(len(attempts), 1)
+
+
+@shared_cache
+class CacheVersionsTestCase(SchedulingDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.location = self.create_location()
+
+    def test_versions_are_bumped_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.name = 'Room 2'
+            self.location.save()
+            # a concurrent request still reads the old data, until the change is committed
+            self.assertEqual(caching.get_location_data(['list'], lambda: 'Room 1'), 'Room 1')
+
+        self.assertEqual(caching.get_location_data(['list'], lambda: 'Room 2'), 'Room 2')
+
+    @process_local_cache
+    def test_process_local_cache(self):
+        self.assertFalse(caching.is_shared())
+        self.assertEqual(caching.get_timeout(), settings.AVAILABILITY_CACHE['LOCAL_TIMEOUT'])
+        self.assertEqual(caching.get_location_data(['list'], lambda: 'Room 1'), 'Room 1')
+        self.assertEqual(caching.get_location_data(['list'], lambda: 'Room 2'), 'Room 1')
+        self.assertEqual(caching.get_stats()['hits'], 1)
+
+        # changes made through this process are still seen at once
+        with self.captureOnCommitCallbacks(execute=True):
+            self.location.name = 'Room 2'
+            self.location.save()
+        self.assertEqual(caching.get_location_data(['list'], lambda: 'Room 2'), 'Room 2')
+
+
+@shared_cache
+class ConditionalGetTestCase(SchedulingDataMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.schedule = self.create_schedule(self.today.weekday(), time(0), time(23))
+        self.location = self.create_location(schedules=[self.schedule])
+        self.worker = self.create_worker(schedules=[self.schedule])
+        self.client = self.create_admin_client()
+
+    def get_etag(self, url: str) -> str:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response['ETag']
+
+    def test_not_modified(self):
+        for url in ('/workers/', f'/workers/{self.worker.pk}/', '/locations/', f'/locations/{self.location.pk}/',
+                    '/work_schedules/', f'/work_schedules/{self.schedule.pk}/'):
+            etag = self.get_etag(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag), url)
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='W/"outdated"').status_code, 200, url)
+            self.assertNotEqual(self.get_etag(f'{url}?fields=pk'), etag, url)
+
+    def test_etag_versions_are_required(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'ScheduleListView has to define get_etag_versions()'):
+            class ScheduleListView(ConditionalGetMixin, ListAPIView):
+                queryset = Schedule.objects.all()
+
+    @process_local_cache
+    def test_no_etags_with_process_local_cache(self):
+        response = self.client.get('/workers/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get('/workers/', HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+    def test_etags_follow_changes(self):
+        urls = ('/workers/', f'/workers/{self.worker.pk}/', '/locations/', '/work_schedules/')
+        etags = {url: self.get_etag(url) for url in urls}
+
+        def assertChanged(*changed_urls):
+            for url in urls:
+                etag = self.get_etag(url)
+                (self.assertNotEqual if url in changed_urls else self.assertEqual)(etag, etags[url], url)
+                etags[url] = etag
+
+        # today's slots are a part of the workers' data
+        self.create_appointment(self.today, time(22), time(23), self.worker, self.location, self.create_client())
+        assertChanged('/workers/', f'/workers/{self.worker.pk}/')
+
+        self.location.name = 'Room 2'
+        self.location.save()
+        assertChanged('/locations/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.schedule.to_hour = time(22)
+            self.schedule.save()
+        assertChanged(*urls)
+
+    def test_gzip(self):
+        Schedule.objects.bulk_create([Schedule(weekday=weekday, from_hour=time(hour), to_hour=time(hour + 1))
+                                      for weekday in range(7) for hour in range(8, 12)])
+        plain = self.client.get('/work_schedules/')
+        compressed = self.client.get('/work_schedules/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertGreaterEqual(len(plain.content), 1024)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed['ETag'], plain['ETag'])
+
+        small = self.client.get(f'/work_schedules/{self.schedule.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
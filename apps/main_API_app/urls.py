@@ -6,7 +6,7 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 # Local app imports
 from .views import WorkerViewSet, LocationViewSet, ScheduleViewSet, ClientViewSet, AppointmentViewSet, ManagerViewSet, \
     RetrieveUpdateDeleteWorkerView, RetrieveUpdateDeleteLocationView, FilterWorkersView, \
-    RetrieveUpdateDeleteManagerView, RetrieveUpdateDeleteAppointmentView
+    RetrieveUpdateDeleteManagerView, RetrieveUpdateDeleteAppointmentView, AvailabilityCacheStatsView
 
 router = routers.DefaultRouter()
 router.register(r'workers', WorkerViewSet)
@@ -24,6 +24,7 @@ urlpatterns = [
     path('locations/<int:pk>/', RetrieveUpdateDeleteLocationView.as_view(), name='location_get_delete_update'),
     path('appointments/<int:pk>/', RetrieveUpdateDeleteAppointmentView.as_view(), name='appointment_get_delete_update'),
     re_path(r'^filter-specialists/(?P<date>)/(?P<specialty>\w+)$', FilterWorkersView.as_view({'get': 'list'}), name='filter_workers'),
+    path('availability-cache/stats/', AvailabilityCacheStatsView.as_view(), name='availability_cache_stats'),
     path('auth/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
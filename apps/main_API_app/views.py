@@ -1,72 +1,295 @@
 # Standard library imports
-from datetime import datetime
+from datetime import date, datetime
 
 # Third party imports
 from django.contrib.auth.models import User
-from rest_framework import viewsets, generics
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import viewsets, generics, views, status
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
+from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
 
 # Local app imports
 from .serializers import UserSerializer, WorkerSerializer, AppointmentSerializer,\
-    ClientSerializer, ScheduleSerializer, LocationSerializer
+    ClientSerializer, ScheduleSerializer, LocationSerializer, AppointmentBulkSerializer
 from .models import Worker, Appointment, Client, Schedule, Location
-from .mixins import SuperuserRequiredMixin
+from .mixins import SuperuserRequiredMixin, AvailableSlotsMixin, ResourceImportMixin, SparseFieldsMixin, \
+    ValuesListMixin, ConditionalGetMixin
+from .pagination import KeysetPagination
+from .routers import ReplicaReadsMixin
+from .booking import book_appointments
+from .exporting import EXPORT_FORMATS, export_appointments
+from .listing import APPOINTMENT_CONVERTER, CLIENT_CONVERTER, SCHEDULE_CONVERTER
+from .schedules import get_schedule_index
+from . import caching
+from .availability import group_appointments, get_range_free_slots, get_dates_range, \
+    find_earliest_slots
+
+
+def parse_requested_date(value: str, parameter: str = 'date', allow_past: bool = False) -> date:
+    """
+    Parses a date from the query parameters. The date can't be in the past, unless allow_past is True.
+    :param value: date string in '%Y-%m-%d' format
+    :param parameter: query parameter name, used in error messages
+    :param allow_past: whether past dates are allowed
+    :return: date
+    """
+    try:
+        requested_date = datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValidationError({parameter: f'time data {value} does not match format %Y-%m-%d'})
+
+    if not allow_past and requested_date < datetime.today().date():
+        raise ValidationError({parameter: f'Date can not be in the past'})
+
+    return requested_date
+
+
+def parse_positive_integer(value: str, parameter: str, maximum: int = None) -> int:
+    """
+    Parses a positive integer from the query parameters.
+    :param value: integer string
+    :param parameter: query parameter name, used in error messages
+    :param maximum: the largest allowed value
+    :return: int
+    """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({parameter: f'{value} is not a valid integer'})
+
+    if number < 1 or (maximum and number > maximum):
+        raise ValidationError({parameter: f'Value must be from 1 to {maximum}' if maximum
+                               else 'Value must be a positive integer'})
+
+    return number
+
+
+def parse_date_range(query_params, max_days: int) -> tuple:
+    """
+    Parses 'from' and 'to' dates (inclusive) from the query parameters.
+    :param query_params: request's query parameters
+    :param max_days: the longest allowed range
+    :return: (date from, date to)
+    """
+    date_from = parse_requested_date(query_params.get('from'), 'from')
+    date_to = parse_requested_date(query_params.get('to'), 'to')
+
+    if date_to < date_from:
+        raise ValidationError({'to': f'Date can not be before {date_from}'})
+    if (date_to - date_from).days >= max_days:
+        raise ValidationError({'to': f'Date range can not be longer than {max_days} days'})
+
+    return date_from, date_to
+
+
+def filter_workers(query_params) -> tuple:
+    """
+    Filters workers by 'date' and 'specialty' query parameters. If not specified, retrieves all instances.
+    :param query_params: request's query parameters
+    :return: (queryset with prefetched work_schedule, requested date or today)
+    """
+    requested_date = query_params.get('date')
+    current_date = datetime.today().date()
+    if requested_date:
+        requested_date = parse_requested_date(requested_date)
+
+    specialty = query_params.get('specialty')
+
+    # workers, that work at the weekday, are taken from the ScheduleIndex instead of joining the schedules
+    if requested_date and specialty:
+        queryset = Worker.objects.filter(
+            specialty__iexact=specialty,
+            pk__in=get_schedule_index().get_weekday_worker_pks(requested_date.weekday()))
+    elif requested_date:
+        queryset = Worker.objects.filter(
+            pk__in=get_schedule_index().get_weekday_worker_pks(requested_date.weekday()))
+
+    elif specialty:
+        queryset = Worker.objects.filter(specialty__iexact=specialty)
+
+    else:
+        queryset = Worker.objects.all()
+
+    queryset = queryset.prefetch_related('work_schedule')
+
+    if not queryset.exists():
+        raise ValidationError({'date or specialty': 'No results. Please, try to change the day and/or specialty query.'})
+
+    return queryset, requested_date or current_date
 
 
 # Basic views
-class WorkerViewSet(viewsets.ModelViewSet):
+class WorkerViewSet(ConditionalGetMixin, ReplicaReadsMixin, SparseFieldsMixin, AvailableSlotsMixin,
+                    ResourceImportMixin, viewsets.ModelViewSet):
     """
     ViewSet for Worker.
     """
-    queryset = Worker.objects.all()
+    queryset = Worker.objects.prefetch_related('work_schedule')
     serializer_class = WorkerSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_etag_versions(self) -> list:
+        """
+        Workers come with today's available slots, so the appointments of today are a part of the data.
+        """
+        today = datetime.today().date()
+        if self.action == 'list':
+            return [caching.SCHEDULES_VERSION, caching.specialty_version(), caching.day_version(today)]
+        return [caching.SCHEDULES_VERSION, caching.worker_version(self.kwargs['pk']),
+                caching.worker_day_version(self.kwargs['pk'], today)]
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ReplicaReadsMixin, SparseFieldsMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for Appointment.
     """
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    values_converter = APPOINTMENT_CONVERTER
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('date', 'start_time', 'pk')
 
+    # The largest number of appointments, that can be created with a single bulk request
+    max_bulk_size = 10000
 
-class ClientViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        """
+        Allows filtering appointments by date range ('from' and 'to' dates, inclusive), worker and location.
+        """
+        queryset = super(AppointmentViewSet, self).get_queryset()
+        query_params = self.request.query_params
+
+        if query_params.get('from'):
+            queryset = queryset.filter(date__gte=parse_requested_date(query_params.get('from'), 'from',
+                                                                      allow_past=True))
+        if query_params.get('to'):
+            queryset = queryset.filter(date__lte=parse_requested_date(query_params.get('to'), 'to',
+                                                                      allow_past=True))
+        if query_params.get('worker'):
+            queryset = queryset.filter(worker=parse_positive_integer(query_params.get('worker'), 'worker'))
+        if query_params.get('location'):
+            queryset = queryset.filter(location=parse_positive_integer(query_params.get('location'), 'location'))
+
+        return queryset
+
+    @action(detail=False, url_path=r'export/(?P<file_format>csv|ndjson)')
+    def export(self, request, file_format, *args, **kwargs):
+        """
+        Streams all of the appointments, that match the filters (see get_queryset()), as CSV or NDJSON.
+        Unlike the list, the response isn't built in memory, so it can be used for any number of rows.
+        """
+        response = StreamingHttpResponse(export_appointments(self.get_queryset(), file_format),
+                                         content_type=EXPORT_FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="appointments.{file_format}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Creates many appointments at once. Accepts a list of appointments, validates the whole batch
+        in memory (including conflicts between its items) and inserts the valid ones in one transaction.
+        Returns the created appointment or the errors for every item, in the same order.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': 'Expected a list of appointments.'})
+        if len(request.data) > self.max_bulk_size:
+            raise ValidationError({'non_field_errors': f'Up to {self.max_bulk_size} appointments can be created '
+                                                       f'at once.'})
+
+        item_serializer = AppointmentBulkSerializer()
+        results = [None] * len(request.data)
+        valid_indexes, valid_items = [], []
+        for index, item in enumerate(request.data):
+            try:
+                valid_items.append(item_serializer.run_validation(item))
+                valid_indexes.append(index)
+            except ValidationError as error:
+                results[index] = error.detail
+
+        for index, result in zip(valid_indexes, book_appointments(valid_items)):
+            results[index] = result
+
+        created = [result for result in results if isinstance(result, Appointment)]
+        created_data = iter(AppointmentSerializer(created, many=True).data)
+        data = [next(created_data) if isinstance(result, Appointment) else {'errors': result} for result in results]
+
+        return Response({'created': len(created), 'failed': len(results) - len(created), 'results': data},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+
+class ClientViewSet(ReplicaReadsMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for Client.
     """
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    values_converter = CLIENT_CONVERTER
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
 
-class ScheduleViewSet(viewsets.ModelViewSet):
+class ScheduleViewSet(ConditionalGetMixin, ReplicaReadsMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet for Schedule.
     """
     queryset = Schedule.objects.all()
     serializer_class = ScheduleSerializer
+    values_converter = SCHEDULE_CONVERTER
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('weekday', 'from_hour', 'pk')
+
+    def get_etag_versions(self) -> list:
+        # bumped on every change of the Schedule table, bulk ones included
+        return [caching.SCHEDULE_INDEX_VERSION]
 
 
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(ConditionalGetMixin, ReplicaReadsMixin, SparseFieldsMixin, ResourceImportMixin,
+                      viewsets.ModelViewSet):
     """
     ViewSet for Location.
     """
-    queryset = Location.objects.all()
+    queryset = Location.objects.prefetch_related('work_schedule')
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_etag_versions(self) -> list:
+        return [caching.SCHEDULES_VERSION, caching.LOCATIONS_VERSION]
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lists locations. The data is cached (per selected fields) until a location or a schedule changes.
+        """
+        if self.paginator is not None:
+            return super(LocationViewSet, self).list(request, *args, **kwargs)
+
+        return Response(caching.get_location_data(('list', *self.get_selected_fields()),
+                                                  lambda: super(LocationViewSet, self).list(request, *args,
+                                                                                            **kwargs).data))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieves a location. The data is cached (per selected fields) until a location or a schedule changes.
+        """
+        return Response(caching.get_location_data((kwargs.get('pk'), *self.get_selected_fields()),
+                                                  lambda: super(LocationViewSet, self).retrieve(request, *args,
+                                                                                                **kwargs).data))
+
 
-class ManagerViewSet(viewsets.ModelViewSet):
+class ManagerViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     ViewSet for single User instance.
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """
@@ -79,30 +302,32 @@ class ManagerViewSet(viewsets.ModelViewSet):
 
 
 # Views for working with separate instances
-class RetrieveUpdateDeleteWorkerView(SuperuserRequiredMixin, generics.RetrieveUpdateDestroyAPIView):
+class RetrieveUpdateDeleteWorkerView(SuperuserRequiredMixin, SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     ViewSet for single Worker instance.
     """
-    queryset = Worker.objects.all()
+    queryset = Worker.objects.prefetch_related('work_schedule')
     serializer_class = WorkerSerializer
     permission_classes = [IsAuthenticated]
 
 
-class RetrieveUpdateDeleteLocationView(SuperuserRequiredMixin, generics.RetrieveUpdateDestroyAPIView):
+class RetrieveUpdateDeleteLocationView(SuperuserRequiredMixin, SparseFieldsMixin,
+                                       generics.RetrieveUpdateDestroyAPIView):
     """
     ViewSet for single Location instance.
     """
-    queryset = Location.objects.all()
+    queryset = Location.objects.prefetch_related('work_schedule')
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
 
 
-class RetrieveUpdateDeleteAppointmentView(SuperuserRequiredMixin, generics.RetrieveUpdateDestroyAPIView):
+class RetrieveUpdateDeleteAppointmentView(SuperuserRequiredMixin, SparseFieldsMixin,
+                                          generics.RetrieveUpdateDestroyAPIView):
     """
     ViewSet for single Appointment instance.
     """
     queryset = Appointment.objects.all()
-    serializer_class = LocationSerializer
+    serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
 
 
@@ -113,6 +338,7 @@ class RetrieveUpdateDeleteManagerView(SuperuserRequiredMixin, generics.RetrieveU
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    lookup_url_kwarg = 'id'
 
     def get_queryset(self):
         """
@@ -125,12 +351,21 @@ class RetrieveUpdateDeleteManagerView(SuperuserRequiredMixin, generics.RetrieveU
 
 
 # User's views
-class FilterWorkersView(viewsets.ReadOnlyModelViewSet):
+class FilterWorkersView(ReplicaReadsMixin, SparseFieldsMixin, AvailableSlotsMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for non-authenticated users. Allows retrieving and filtering Worker instances.
     """
     serializer_class = WorkerSerializer
 
+    # The longest date range, that can be requested at once, and the range length (in days),
+    # starting from which the response is streamed worker by worker
+    max_range_days = 62
+    streaming_range_days = 14
+
+    # Limits for the earliest available slots search
+    max_earliest_count = 50
+    max_lookahead_days = 90
+
     def get_serializer_context(self):
         """
         Allows passing url parameters from FilterWorkersView to serializer.
@@ -144,37 +379,113 @@ class FilterWorkersView(viewsets.ReadOnlyModelViewSet):
         Retrieves Worker database objects, that match search criteria by date and specialty.
         If not specified, retrieves all instances.
         """
-        requested_date = self.request.query_params.get('date')
-        current_date = datetime.today().date()
-        if requested_date:
-            try:
-                requested_date = datetime.strptime(requested_date, '%Y-%m-%d').date()
-                if requested_date < current_date:
-                    raise ValidationError({'date': f'Date can not be in the past'})
-
-            except ValueError:
-                raise ValidationError({'date': f'time data {requested_date} does not match format %Y-%m-%d'})
+        queryset, self.requested_date = filter_workers(self.request.query_params)
+        return queryset
 
-        specialty = self.request.query_params.get('specialty')
+    def list(self, request, *args, **kwargs):
+        """
+        Lists the filtered workers. Available slots of all listed workers are calculated at once
+        from preloaded schedules and appointments, instead of querying them for every worker.
+        Whole responses are cached per (date, specialty, selected fields), see caching.py.
+        """
+        if self.paginator is not None:
+            return super(FilterWorkersView, self).list(request, *args, **kwargs)
 
-        if requested_date and specialty:
-            schedules = Schedule.objects.filter(weekday=requested_date.weekday())
-            schedule_pks = [sched.pk for sched in schedules]
-            queryset = Worker.objects.filter(specialty__iexact=specialty,
-                                             work_schedule__in=schedule_pks)
-        elif requested_date:
-            schedules = Schedule.objects.filter(weekday=requested_date.weekday())
-            schedule_pks = [sched.pk for sched in schedules]
-            queryset = Worker.objects.filter(work_schedule__in=schedule_pks)
+        requested_date = request.query_params.get('date')
+        specialty = request.query_params.get('specialty')
 
-        elif specialty:
-            queryset = Worker.objects.filter(specialty__iexact=specialty)
+        data = caching.get_worker_list(parse_requested_date(requested_date) if requested_date
+                                       else datetime.today().date(),
+                                       bool(requested_date), specialty, self.get_selected_fields(),
+                                       lambda: self.get_list_data(self.filter_queryset(self.get_queryset())))
+        return Response(data)
 
+    @action(detail=False, url_path='range')
+    def date_range(self, request, *args, **kwargs):
+        """
+        Retrieves workers with their available slots for every day from 'from' to 'to' date (inclusive),
+        optionally filtered by specialty. Appointments for the whole range are loaded with one query.
+        Large ranges are streamed worker by worker.
+        """
+        date_from, date_to = parse_date_range(request.query_params, self.max_range_days)
+
+        queryset = Worker.objects.all()
+        specialty = request.query_params.get('specialty')
+        if specialty:
+            queryset = queryset.filter(specialty__iexact=specialty)
+
+        workers = list(self.filter_queryset(queryset.prefetch_related('work_schedule')))
+        if not workers:
+            raise ValidationError({'specialty': 'No results. Please, try to change the specialty query.'})
+
+        dates = get_dates_range(date_from, date_to)
+        slots_selected = 'available_slots' in self.get_selected_fields()
+        appointments = group_appointments(workers, date_from, date_to) if slots_selected else None
+        schedule_index = get_schedule_index() if slots_selected else None
+
+        def serialize(worker: Worker) -> dict:
+            context = self.get_serializer_context()
+            if slots_selected:
+                context.update({'available_slots': {worker.pk: get_range_free_slots(worker, dates, appointments,
+                                                                                     schedule_index)}})
+            return self.get_serializer(worker, context=context).data
+
+        if len(dates) < self.streaming_range_days:
+            return Response([serialize(worker) for worker in workers])
+
+        def stream():
+            renderer = JSONRenderer()
+            yield b'['
+            for index, worker in enumerate(workers):
+                yield (b',' if index else b'') + renderer.render(serialize(worker))
+            yield b']'
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
+    @action(detail=False)
+    def earliest(self, request, *args, **kwargs):
+        """
+        Retrieves the first free slots among all workers of the specialty, in time order.
+        Query parameters:
+            specialty - required;
+            count - number of slots to return (1 by default);
+            from - date to start looking from (today by default);
+            days - how many days to look ahead;
+            location - location pk, or 'any'. If given, a free location is required as well.
+        Every slot has the same fields as an appointment, so it can be booked as it is.
+        """
+        specialty = request.query_params.get('specialty')
+        if not specialty:
+            raise ValidationError({'specialty': 'This query parameter is required.'})
+
+        now = timezone.localtime()
+        date_from = request.query_params.get('from')
+        date_from = parse_requested_date(date_from, 'from') if date_from else now.date()
+
+        count = parse_positive_integer(request.query_params.get('count', 1), 'count', self.max_earliest_count)
+        days = parse_positive_integer(request.query_params.get('days', self.max_lookahead_days), 'days',
+                                      self.max_lookahead_days)
+
+        workers = Worker.objects.filter(specialty__iexact=specialty)
+        if not workers:
+            raise ValidationError({'specialty': 'No results. Please, try to change the specialty query.'})
+
+        location = request.query_params.get('location')
+        if location == 'any':
+            locations = Location.objects.all()
+        elif location:
+            locations = Location.objects.filter(pk=parse_positive_integer(location, 'location'))
         else:
-            queryset = Worker.objects.all()
+            locations = None
 
-        if not queryset:
-            raise ValidationError({'date or specialty': 'No results. Please, try to change the day and/or specialty query.'})
+        return Response(find_earliest_slots(workers, date_from, count, days, locations, now))
 
-        return queryset
 
+class AvailabilityCacheStatsView(views.APIView):
+    """
+    View for admins. Shows availability cache hit/miss counters.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(caching.get_stats())
@@ -0,0 +1,10 @@
+# Gunicorn configuration, loaded automatically from the working directory.
+
+def child_exit(server, worker):
+    """
+    Removes live gauges of the exited worker from the shared metrics (see apps/main_API_app/metrics.py).
+    """
+    import os
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
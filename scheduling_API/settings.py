@@ -52,6 +52,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # compresses the final response, so it goes first
+    'apps.main_API_app.compression.LargeResponseGZipMiddleware',
+    'apps.main_API_app.instrumentation.RequestInstrumentationMiddleware',
+    'apps.main_API_app.metrics.MetricsMiddleware',
+    'apps.main_API_app.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +101,41 @@ if os.environ.get('DATABASE_URL'):
     db_from_env = dj_database_url.config(conn_max_age=500)
     DATABASES['default'].update(db_from_env)
 
+# SQLite mode for several gunicorn workers (see apps/main_API_app/backends/sqlite3/base.py): with WAL journal readers
+# don't block the writer, writers wait up to SQLITE_BUSY_TIMEOUT seconds for the lock, transactions take the write lock
+# when they begin, and connections are kept between requests. synchronous=NORMAL doesn't sync every commit to disk
+# (the last commits may be lost at a power failure, but the database can't be corrupted).
+# SQLITE_WAL=off keeps the defaults of Django.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' and os.environ.get('SQLITE_WAL', 'on') != 'off':
+    DATABASES['default'].update({
+        'ENGINE': 'apps.main_API_app.backends.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5)),
+            'init_command': 'PRAGMA journal_mode=WAL; '
+                            f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+# Optional read replica. Reads of list and retrieve views go there (see apps/main_API_app/routers.py),
+# e.g. REPLICA_DATABASE_URL=sqlite:////path/to/replica.sqlite3 for a local copy of db.sqlite3.
+# The test suite is run without it, the replica has no test database of its own.
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = {
+        **dj_database_url.parse(os.environ.get('REPLICA_DATABASE_URL'), conn_max_age=500),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['apps.main_API_app.routers.ReplicaRouter']
+
+# STICKY_SECONDS: how long a client reads from the primary after a write, so it sees its own changes
+READ_REPLICA = {
+    'ALIAS': 'replica',
+    'STICKY_SECONDS': 10,
+    'COOKIE': 'read_primary',
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -139,7 +179,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.main_API_app.authentication.CachedJWTAuthentication',
     ],
 }
 
@@ -149,3 +189,110 @@ SIMPLE_JWT = {
 }
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static/")
+
+# Availability slots (in minutes). SLOT_LENGTH and BUFFER_TIME can be overridden
+# per specialty here, or per worker with the Worker.slot_length and Worker.buffer_time fields.
+APPOINTMENT_SLOTS = {
+    'SLOT_LENGTH': 60,
+    'BUFFER_TIME': 0,
+    'SPECIALTIES': {},
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # available slots are cached per worker and date, so the default (300) would be culled by a single list
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
+# Cached availability and ETags (see apps/main_API_app/caching.py). TIMEOUT is in seconds.
+# ETags are used only if all processes share the cache, and entries of a per-process cache are kept only
+# for LOCAL_TIMEOUT seconds. SHARED = None detects it from the backend (the memory cache is per process),
+# True or False overrides it.
+AVAILABILITY_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+    'LOCAL_TIMEOUT': 10,
+    'SHARED': None,
+}
+
+# Snapshots of JWT authenticated users (see apps/main_API_app/authentication.py). TIMEOUT is in seconds.
+# Like cached availability, they are used only if all processes share the cache (SHARED works the same way).
+JWT_USER_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+    'SHARED': None,
+}
+
+# Responses, that are at least this long (in bytes), are gzip-compressed for clients, that accept it
+GZIP_MIN_LENGTH = 1024
+
+# Bookings, that fail because the database is locked by another writer (SQLite), are retried
+# up to LOCKED_RETRIES times with exponential backoff, starting with LOCKED_RETRY_DELAY seconds.
+BOOKING = {
+    'LOCKED_RETRIES': 10,
+    'LOCKED_RETRY_DELAY': 0.005,
+}
+
+# Per-request SQL and latency instrumentation (see apps/main_API_app/instrumentation.py).
+# Requests, that are slower (in milliseconds) or run more queries, are logged with their most repeated queries.
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_REQUEST_QUERIES': 50,
+    'TOP_QUERIES': 5,
+}
+
+# Prometheus metrics at /metrics (see apps/main_API_app/metrics.py). They can be read from ALLOWED_IPS,
+# or with "Authorization: Bearer <METRICS_TOKEN>" header. METRICS_ENABLED=off turns the endpoint off.
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'on') != 'off',
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+}
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+# APP_LOG_FORMAT is 'json' (one JSON object per line), 'text' or 'off'.
+# APP_LOG_LEVEL=DEBUG also logs every rejected booking.
+
+APP_LOG_FORMAT = os.environ.get('APP_LOG_FORMAT', 'json')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'apps.main_API_app.instrumentation.JsonFormatter',
+        },
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'text' if APP_LOG_FORMAT == 'text' else 'json',
+        },
+        'null': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        'apps.main_API_app': {
+            'handlers': ['null' if APP_LOG_FORMAT == 'off' else 'console'],
+            'level': os.environ.get('APP_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}